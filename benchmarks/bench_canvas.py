@@ -0,0 +1,102 @@
+"""
+Benchmark pages for the SVG and canvas renderers of the generated maps.
+
+Run with ``python benchmarks/bench_canvas.py [outdir]``. Each figure is
+written once per renderer, and outdir/index.html lists the pages with their
+feature counts, to compare panning and zooming in a browser.
+"""
+import os
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+
+import spatplotlib
+
+
+def contour_figure(n):
+    x, y = np.meshgrid(np.linspace(-10, 10, n), np.linspace(40, 50, n))
+    fig, ax = plt.subplots(figsize=(12, 9))
+    ax.contourf(x, y, np.sin(3 * x) * np.cos(3 * y) + np.sin(x * y / 10),
+                levels=40)
+    return fig
+
+
+def tracks_figure(n, length=200):
+    rng = np.random.default_rng(0)
+    fig, ax = plt.subplots(figsize=(12, 9))
+    steps = rng.normal(scale=0.02, size=(n, length, 2)).cumsum(axis=1)
+    starts = rng.uniform([-10, 40], [10, 50], size=(n, 1, 2))
+    for track in starts + steps:
+        ax.plot(track[:, 0], track[:, 1], lw=1)
+    return fig
+
+
+def scatter_figure(n):
+    rng = np.random.default_rng(0)
+    fig, ax = plt.subplots(figsize=(12, 9))
+    ax.scatter(rng.uniform(-10, 10, n), rng.uniform(40, 50, n),
+               c=rng.uniform(size=n), s=9)
+    return fig
+
+
+def count_features(make_fig):
+    """Return the number of paths and markers Leaflet will create"""
+    gj = spatplotlib.fig_to_geojson(make_fig())
+    paths = markers = vertices = 0
+    for feature in gj['features']:
+        geometry = feature['geometry']
+        coords = geometry['coordinates']
+        if geometry['type'] in ('Point', 'MultiPoint'):
+            markers += len(np.reshape(coords, (-1, 2)))
+        elif geometry['type'] == 'Polygon':
+            paths += 1
+            vertices += sum(len(ring) for ring in coords)
+        else:
+            paths += 1
+            vertices += len(coords)
+    return paths, markers, vertices
+
+
+def main(outdir='_bench_canvas'):
+    os.makedirs(outdir, exist_ok=True)
+    cases = [
+        ('contourf 400x400', lambda: contour_figure(400)),
+        ('tracks 2000', lambda: tracks_figure(2000)),
+        ('scatter 2e4', lambda: scatter_figure(20_000)),
+    ]
+    rows = []
+    for name, make_fig in cases:
+        paths, markers, vertices = count_features(make_fig)
+        links = []
+        for renderer in ('svg', 'canvas'):
+            filename = '{}_{}.html'.format(name.split()[0], renderer)
+            start = time.perf_counter()
+            html = spatplotlib.fig_to_html(make_fig(), renderer=renderer)
+            elapsed = time.perf_counter() - start
+            with open(os.path.join(outdir, filename), 'w') as f:
+                f.write(html)
+            links.append('<a href="{}">{}</a> ({:.1f} MB, {:.2f} s)'.format(
+                filename, renderer, len(html) / 1e6, elapsed))
+            plt.close('all')
+        rows.append((name, paths, vertices, markers, links))
+        print('{:<20} {:>8} paths {:>10} vertices {:>8} markers'.format(
+            name, paths, vertices, markers))
+
+    with open(os.path.join(outdir, 'index.html'), 'w') as f:
+        f.write('<table border="1"><tr><th>figure</th><th>paths</th>'
+                '<th>vertices</th><th>markers</th><th>svg</th>'
+                '<th>canvas</th></tr>\n')
+        for name, paths, vertices, markers, links in rows:
+            f.write('<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td>'
+                    '<td>{}</td><td>{}</td></tr>\n'.format(
+                        name, paths, vertices, markers, *links))
+        f.write('</table>\n')
+    print('Open {}'.format(os.path.join(outdir, 'index.html')))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
@@ -0,0 +1,66 @@
+"""
+Compare the cost of the exporter's draw modes.
+
+Run with ``python benchmarks/bench_exporter.py``. Each figure is exported
+with the throwaway-PNG draw ('png') and the layout-only draw ('layout').
+"""
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+
+from spatplotlib.exporter import Exporter
+from spatplotlib.leaflet_renderer import LeafletRenderer
+
+
+def scatter_figure(n):
+    rng = np.random.default_rng(0)
+    fig, ax = plt.subplots(figsize=(12, 9))
+    ax.scatter(rng.uniform(-10, 10, n), rng.uniform(40, 50, n),
+               c=rng.uniform(size=n))
+    return fig
+
+
+def contour_figure(n):
+    x, y = np.meshgrid(np.linspace(-10, 10, n), np.linspace(40, 50, n))
+    fig, ax = plt.subplots(figsize=(12, 9))
+    ax.contourf(x, y, np.sin(x) * np.cos(y / 2), levels=20)
+    return fig
+
+
+class _NullRenderer(LeafletRenderer):
+    """Skip feature construction so only the draw step is measured."""
+    def draw_path(self, *args, **kwargs):
+        pass
+
+
+def time_draw(make_fig, draw_mode, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        fig = make_fig()
+        exporter = Exporter(_NullRenderer(), draw_mode=draw_mode)
+        start = time.perf_counter()
+        exporter.run(fig)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    cases = [
+        ('scatter 1e4', lambda: scatter_figure(10_000)),
+        ('scatter 1e5', lambda: scatter_figure(100_000)),
+        ('contourf 500x500', lambda: contour_figure(500)),
+    ]
+    print('{:<20} {:>10} {:>10} {:>8}'.format('figure', 'png (s)',
+                                             'layout (s)', 'speedup'))
+    for name, make_fig in cases:
+        png = time_draw(make_fig, 'png')
+        layout = time_draw(make_fig, 'layout')
+        print('{:<20} {:>10.3f} {:>10.3f} {:>7.1f}x'.format(
+            name, png, layout, png / layout))
+
+
+if __name__ == '__main__':
+    main()
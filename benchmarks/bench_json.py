@@ -0,0 +1,59 @@
+"""
+Benchmark of utils.ArrayEncoder against utils.FloatEncoder.
+
+Run with ``python benchmarks/bench_json.py``. Each case is a GeoJSON-like
+dictionary of NumPy arrays, as returned by LeafletRenderer.geojson(), with
+its vertices in a few long lines or in many small rings. Both encoders
+must give the same text, which is checked once per case.
+"""
+import json
+import time
+
+import numpy as np
+
+from spatplotlib import utils
+
+
+def make_geojson(n, ring_size):
+    """A FeatureCollection of n vertices in rings of ring_size vertices"""
+    rng = np.random.default_rng(0)
+    vertices = rng.uniform([-180, -90], [180, 90], size=(n, 2))
+    features = [{
+        "type": "Feature",
+        "geometry": {"type": "Polygon",
+                     "coordinates": [vertices[i:i + ring_size]]},
+        "properties": {"color": "#1f77b4", "weight": 1.0},
+    } for i in range(0, n, ring_size)]
+    return {"type": "FeatureCollection", "features": features}
+
+
+def best_of(func, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(precision=6):
+    print('{:>10} {:>10} {:>14} {:>14} {:>8}'.format(
+        'vertices', 'ring size', 'FloatEncoder', 'ArrayEncoder', 'speedup'))
+    for n in [10 ** 4, 10 ** 5, 10 ** 6]:
+        for ring_size in [10, 1000, n]:
+            gj = make_geojson(n, ring_size)
+            expected = json.dumps(gj, cls=utils.FloatEncoder,
+                                  precision=precision)
+            assert json.dumps(gj, cls=utils.ArrayEncoder,
+                              precision=precision) == expected
+            before = best_of(lambda: json.dumps(gj, cls=utils.FloatEncoder,
+                                                precision=precision),
+                             1 if n >= 10 ** 6 else 3)
+            after = best_of(lambda: json.dumps(gj, cls=utils.ArrayEncoder,
+                                               precision=precision))
+            print('{:>10} {:>10} {:>13.4f}s {:>13.4f}s {:>7.1f}x'.format(
+                n, ring_size, before, after, before / after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Microbenchmarks for utils.SVG_path and utils.iter_rings.
+
+Run with ``python benchmarks/bench_utils.py``. The per-segment versions the
+functions replaced are timed alongside for reference (skipped above 1e6
+vertices, where they take too long to be useful).
+"""
+import itertools
+import time
+
+import numpy as np
+from matplotlib.path import Path
+
+from spatplotlib import utils
+
+
+def svg_path_segments(path):
+    vc_tuples = [(vertices if path_code != Path.CLOSEPOLY else [],
+                  utils.PATH_DICT[path_code])
+                 for (vertices, path_code) in path.iter_segments()]
+    vertices, codes = zip(*vc_tuples)
+    vertices = np.array(list(itertools.chain(*vertices))).reshape(-1, 2)
+    return vertices, list(codes)
+
+
+def iter_rings_points(data, pathcodes):
+    ring = []
+    for point, code in zip(data, pathcodes):
+        if code == 'M':
+            if len(ring):
+                yield ring
+            ring = [point]
+        else:
+            ring.append(point)
+    if len(ring):
+        yield ring
+
+
+def make_path(n, ring_size=1000):
+    """A path of n vertices made of closed rings of ring_size vertices"""
+    rng = np.random.default_rng(0)
+    vertices = rng.uniform(size=(n, 2))
+    codes = np.full(n, Path.LINETO, dtype=Path.code_type)
+    codes[::ring_size] = Path.MOVETO
+    codes[ring_size - 1::ring_size] = Path.CLOSEPOLY
+    return Path(vertices, codes)
+
+
+def best_of(func, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    print('{:>10} {:>14} {:>14} {:>14} {:>14}'.format(
+        'vertices', 'SVG_path', '(segments)', 'iter_rings', '(points)'))
+    for n in [10 ** k for k in range(3, 8)]:
+        path = make_path(n)
+        vertices, codes = utils.SVG_path(path)
+        row = [best_of(lambda: utils.SVG_path(path))]
+        row.append(best_of(lambda: svg_path_segments(path), 1)
+                   if n <= 10 ** 6 else float('nan'))
+        row.append(best_of(lambda: list(utils.iter_rings(vertices, codes))))
+        row.append(best_of(lambda: list(iter_rings_points(vertices, codes)), 1)
+                   if n <= 10 ** 6 else float('nan'))
+        print('{:>10} '.format(n) + ' '.join('{:>13.4f}s'.format(t)
+                                             for t in row))
+
+
+if __name__ == '__main__':
+    main()
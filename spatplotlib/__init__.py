@@ -3,5 +3,18 @@ from .display import (
     display,
     save_html,
     fig_to_html,
+    iter_html,
     fig_to_geojson,
+    fig_to_topojson,
+)
+from .leaflet_renderer import (
+    transformer_cache_info,
+    clear_transformer_cache,
+)
+from .vectortiles import (
+    fig_to_tiles,
+    serve_tiles,
+)
+from .rasters import (
+    raster_to_tiles,
 )
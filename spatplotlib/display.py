@@ -1,24 +1,51 @@
 import json
 import os
+import re
 import uuid
 import base64
+import itertools
+import zlib
+import hashlib
+import functools
+import http.server
+import tempfile
+import threading
+import urllib.parse
 
 import matplotlib.pyplot as plt
+import numpy as np
 from .exporter import Exporter
 
 from .leaflet_renderer import LeafletRenderer
 from .links import JavascriptLink, CssLink
-from .utils import FloatEncoder
-from . import maptiles, htmlbase, htmlipynb
+from .utils import ArrayEncoder, to_builtins
+from . import maptiles, htmlbase, htmlipynb, encoding
+from .topojson import topology
 
 # TODO need newer versions of these
 # We download explicitly the CSS and the JS.
 _leaflet_js = JavascriptLink('https://cdnjs.cloudflare.com/ajax/libs/leaflet/1.9.4/leaflet.js')
 _leaflet_css = CssLink('https://cdnjs.cloudflare.com/ajax/libs/leaflet/1.9.4/leaflet.css')
+_renderers = ('svg', 'canvas')
+_binary_modes = (None, 'base64', 'sidecar')
+_display_modes = ('base64', 'file', 'server')
+_data_modes = (None, 'sidecar')
+_compress_modes = (None, 'gzip', 'deflate')
+# zlib window bits of the formats of DecompressionStream
+_zlib_wbits = {'gzip': 31, 'deflate': 15}
+# Ids of the map elements, which differ on every export
+_mapid_pattern = re.compile('map[0-9a-f]{32}')
+# Local server of the pages displayed with mode='server', started once
+_page_server = None
+_page_server_lock = threading.Lock()
 _attribution = '<a href="https://github.com/ralian/spatplotlib">spatplotlib</a>'
 
 def fig_to_html(fig=None, generator=htmlbase.format, tiles=None, crs=None,
-                epsg=None, embed_links=False, float_precision=6):
+                epsg=None, embed_links=False, float_precision=6,
+                simplify=None, lod=None, cluster=None, renderer='svg',
+                points='markers', binary=None, binary_path=None,
+                quantize=False, topojson=False, data=None, data_path=None,
+                compress=None):
     """
     Convert a Matplotlib Figure to a Leaflet map
 
@@ -49,9 +76,68 @@ def fig_to_html(fig=None, generator=htmlbase.format, tiles=None, crs=None,
         'crs' parameter.
     embed_links : bool, default False
         Whether external links (except tiles) shall be explicitly embedded in
-        the final html.
+        the final html. They are downloaded once, into the asset cache (see
+        links.cache_asset), which can be seeded on computers without network
+        access.
     float_precision : int, default 6
         The precision to be used for the floats in the embedded geojson.
+    simplify : float, default None
+        If given, lines and polygons are simplified with the Douglas-Peucker
+        algorithm, dropping detail smaller than this many figure pixels
+        (e.g. 1.0). Polygons smaller than that are dropped.
+    lod : int, default None
+        Number of levels of detail to precompute for lines and polygons.
+        Level i is simplified to 2**i times the simplify tolerance (or 2**i
+        pixels if simplify is None), and the map switches to it when zoomed
+        out far enough for that detail to fit in a screen pixel.
+    cluster : float, default None
+        If given, markers are grouped into clusters of this many screen
+        pixels (e.g. 60) at each zoom level, showing their count and mean
+        color. Clusters split as the map is zoomed in, and only the
+        clusters and markers in view are added to the page.
+    renderer : string, default 'svg'
+        How Leaflet draws the features: 'svg' creates one SVG element per
+        feature and markers as icons, 'canvas' draws everything on a canvas,
+        which scales to many more features.
+    points : string, default 'markers'
+        How marker collections are drawn: 'markers' adds a Leaflet marker
+        per point, 'webgl' draws all points as discs of the marker size on
+        a WebGL layer (or a canvas, if WebGL is unavailable). The points
+        can still be hovered and clicked. Takes precedence over cluster.
+    binary : string, default None
+        If given, the coordinates and other arrays are packed into a binary
+        buffer that the page decodes, which loads much faster than JSON
+        numbers. 'base64' embeds the buffer in the page, 'sidecar' writes
+        it to binary_path. Numbers are stored as float32 if float_precision
+        is at most 4, and as float64 otherwise.
+    binary_path : string, default None
+        The file to write the buffer to with binary='sidecar'. The page
+        loads it by its file name, so it must be saved in the same
+        directory as the page, which must be served over http(s).
+    quantize : bool, default False
+        If True, coordinates are snapped to a grid of float_precision
+        decimals and written as integer steps from one point to the next,
+        which the page decodes. This makes them much more compact, as JSON
+        or in a binary buffer.
+    topojson : bool, default False
+        If True, the features are embedded as a TopoJSON topology, where
+        the boundaries shared by polygons (e.g. the bands of contourf) are
+        stored once. With quantize, the arcs are quantized and delta
+        encoded like TopoJSON's. Levels of detail and clusters are dropped.
+    data : string, default None
+        If 'sidecar', the GeoJSON is written to data_path instead of the
+        page, which fetches it once the map is shown. The page stays small,
+        the browser caches the data separately, and several pages can
+        share it. Combines with the other encodings.
+    data_path : string, default None
+        The file to write the GeoJSON to with data='sidecar'. Like
+        binary_path, it is loaded by its file name.
+    compress : string, default None
+        If 'gzip' or 'deflate' (zlib), the GeoJSON is compressed, as it is
+        encoded, and embedded as base64 (or written to the file of
+        data='sidecar'). The page decompresses it with the browser's
+        DecompressionStream, unless the server already did for a sidecar
+        file (Content-Encoding).
 
     Note: only one of 'crs' or 'epsg' may be specified. Both may be None, in
     which case the plot is assumed to be longitude / latitude.
@@ -62,19 +148,103 @@ def fig_to_html(fig=None, generator=htmlbase.format, tiles=None, crs=None,
 
     """
 
+    return ''.join(iter_html(
+        fig, generator=generator, tiles=tiles, crs=crs, epsg=epsg,
+        embed_links=embed_links, float_precision=float_precision,
+        simplify=simplify, lod=lod, cluster=cluster, renderer=renderer,
+        points=points, binary=binary, binary_path=binary_path,
+        quantize=quantize, topojson=topojson, data=data,
+        data_path=data_path, compress=compress))
+
+
+def iter_html(fig=None, generator=htmlbase.format, tiles=None, crs=None,
+              epsg=None, embed_links=False, float_precision=6,
+              simplify=None, lod=None, cluster=None, renderer='svg',
+              points='markers', binary=None, binary_path=None,
+              quantize=False, topojson=False, data=None, data_path=None,
+              compress=None):
+    """
+    Convert a Matplotlib Figure to a Leaflet map, yielding the page in
+    chunks
+
+    The GeoJSON is encoded as the page is written, so the text of the
+    page is never held in memory at once, e.g. to write it to a file or
+    an HTTP response.
+
+    See fig_to_html() for description of keyword args.
+
+    Yields
+    ------
+    Strings of html, which together make the webpage
+
+    """
+
+    if binary not in _binary_modes:
+        raise ValueError("binary must be one of {}, not {!r}"
+                         .format(_binary_modes, binary))
+    if binary == 'sidecar' and binary_path is None:
+        raise ValueError("binary='sidecar' needs a binary_path")
+    if data not in _data_modes:
+        raise ValueError("data must be one of {}, not {!r}"
+                         .format(_data_modes, data))
+    if data == 'sidecar' and data_path is None:
+        raise ValueError("data='sidecar' needs a data_path")
+    if compress not in _compress_modes:
+        raise ValueError("compress must be one of {}, not {!r}"
+                         .format(_compress_modes, compress))
+    if renderer not in _renderers:
+        raise ValueError("renderer must be one of {}, not {!r}"
+                         .format(_renderers, renderer))
     tiles = maptiles.tiles[tiles] if tiles is not None else maptiles.osm
 
     if fig is None:
         fig = plt.gcf()
     dpi = fig.get_dpi()
 
-    renderer = LeafletRenderer(crs=crs, epsg=epsg)
-    exporter = Exporter(renderer)
+    leaflet = LeafletRenderer(crs=crs, epsg=epsg, simplify=simplify, lod=lod,
+                              cluster=cluster, points=points)
+    exporter = Exporter(leaflet)
     exporter.run(fig)
 
-    FloatEncoder._formatter = ".{}f".format(float_precision)
+    gj = leaflet.geojson()
+    bounds = _bounds(gj) if data == 'sidecar' else None
+    if topojson:
+        gj = topology(gj, float_precision, quantize)
+    elif quantize:
+        gj = encoding.quantize(gj, float_precision)
+    if binary is not None:
+        dtype = np.float32 if float_precision <= 4 else np.float64
+        gj, buffer = encoding.pack_buffers(gj, dtype)
+        if binary == 'base64':
+            gj['buffer']['data'] = base64.b64encode(buffer).decode('ascii')
+        else:
+            with open(binary_path, 'wb') as f:
+                f.write(buffer)
+            gj['buffer']['url'] = os.path.basename(binary_path)
+    chunks = ArrayEncoder(precision=float_precision).iterencode(gj)
+    if data == 'sidecar':
+        with open(data_path, 'wb') as f:
+            if compress is not None:
+                for block in _compress(chunks, compress):
+                    f.write(block)
+            else:
+                for chunk in chunks:
+                    f.write(chunk.encode('utf8'))
+        # The page only embeds where to find the data, and its bounds to
+        # show the map until it is loaded
+        gj = {"url": os.path.basename(data_path), "bbox": bounds}
+        if compress is not None:
+            gj["compressed"] = compress
+        chunks = ArrayEncoder(precision=float_precision).iterencode(gj)
+    elif compress is not None:
+        chunks = itertools.chain(
+            ['{{"compressed": "{}", "data": "'.format(compress)],
+            _base64(_compress(chunks, compress)), ['"}'])
+
+    # The page is rendered around a placeholder for the GeoJSON
+    placeholder = '/*geojson-{}*/'.format(uuid.uuid4().hex)
     params = {
-        'geojson': json.dumps(renderer.geojson(), cls=FloatEncoder),
+        'geojson': placeholder,
         'width': fig.get_figwidth()*dpi,
         'height': fig.get_figheight()*dpi,
         'mapid': str(uuid.uuid4()).replace('-', ''),
@@ -82,8 +252,45 @@ def fig_to_html(fig=None, generator=htmlbase.format, tiles=None, crs=None,
         'attribution': _attribution + ' | ' + tiles[1],
         'links': [_leaflet_js,_leaflet_css],
         'embed_links': embed_links,
+        'renderer': renderer,
+        'points': points,
+        'binary': binary,
+        'quantize': quantize,
+        'topojson': topojson,
+        'data': data,
+        'compress': compress,
     }
-    return generator.__call__(**params)
+    head, found, tail = generator(**params).partition(placeholder)
+    if not found or placeholder in tail:
+        # The generator does not embed the GeoJSON once as it is
+        params['geojson'] = ''.join(chunks)
+        yield generator(**params)
+        return
+    yield head
+    yield from chunks
+    yield tail
+
+
+def _compress(chunks, method):
+    """Compress chunks of text with zlib as they come, yielding bytes"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, _zlib_wbits[method])
+    for chunk in chunks:
+        block = compressor.compress(chunk.encode('utf8'))
+        if block:
+            yield block
+    yield compressor.flush()
+
+
+def _base64(blocks):
+    """Encode blocks of bytes to base64 as they come, yielding text"""
+    pending = b''
+    for block in blocks:
+        pending += block
+        # Whole groups of 3 bytes are encoded without padding
+        end = len(pending) - len(pending) % 3
+        yield base64.b64encode(pending[:end]).decode('ascii')
+        pending = pending[end:]
+    yield base64.b64encode(pending).decode('ascii')
 
 
 def fig_to_geojson(fig=None, **kwargs):
@@ -94,9 +301,15 @@ def fig_to_geojson(fig=None, **kwargs):
 
     Returns
     -------
-    GeoJSON dictionary
+    GeoJSON dictionary, of lists and Python numbers like json.loads()
+    returns
 
     """
+    return to_builtins(_geojson(fig, **kwargs))
+
+
+def _geojson(fig=None, **kwargs):
+    """The GeoJSON of a figure, with its coordinates as NumPy arrays"""
     if fig is None:
         fig = plt.gcf()
     renderer = LeafletRenderer(**kwargs)
@@ -106,17 +319,84 @@ def fig_to_geojson(fig=None, **kwargs):
     return renderer.geojson()
 
 
+def fig_to_topojson(fig=None, precision=6, quantize=False, **kwargs):
+    """
+    Returns a figure's TopoJSON representation as a dictionary
+
+    Shared boundaries of lines and polygons are stored once, as arcs.
+    Other arguments passed to fig_to_html()
+
+    Parameters
+    ----------
+    precision : int, default 6
+        Positions are rounded to this many decimals before shared
+        boundaries are found.
+    quantize : bool, default False
+        If True, positions are quantized to the grid of precision, with a
+        TopoJSON transform, and arcs are delta encoded.
+
+    Returns
+    -------
+    TopoJSON dictionary, of lists and Python numbers like json.loads()
+    returns
+
+    """
+    return to_builtins(topology(_geojson(fig, **kwargs), precision,
+                                quantize))
+
+
+def _bounds(gj):
+    """[west, south, east, north] of the features and point layers of a
+    GeoJSON dictionary, or None if it is empty"""
+    positions = []
+
+    def collect(coordinates):
+        if isinstance(coordinates, (list, tuple)) and coordinates and not (
+                np.isscalar(coordinates[0])):
+            for c in coordinates:
+                collect(c)
+        elif len(coordinates):
+            positions.append(np.reshape(coordinates, (-1, 2)))
+
+    for feature in gj['features']:
+        collect(feature['geometry']['coordinates'])
+    for layer in gj.get('points', []):
+        collect(layer['positions'])
+    if not positions:
+        return None
+    positions = np.concatenate(positions)
+    return positions.min(axis=0).tolist() + positions.max(axis=0).tolist()
+
+
 def save_html(fig=None, fileobj='_map.html', **kwargs):
+    # Write sidecar files next to the page, e.g. map.html and map.bin
+    data_extension = {None: '.geojson', 'gzip': '.geojson.gz',
+                      'deflate': '.geojson.deflate'}
+    data_extension = data_extension.get(kwargs.get('compress'))
+    sidecars = [('binary', 'binary_path', '.bin'),
+                ('data', 'data_path', data_extension)]
+    for mode, path, extension in sidecars:
+        if kwargs.get(mode) != 'sidecar' or kwargs.get(path) is not None:
+            continue
+        name = fileobj
+        if not isinstance(name, str):
+            name = getattr(fileobj, 'name', None)
+        if not isinstance(name, str):
+            raise ValueError("{}='sidecar' needs a {} when fileobj has no "
+                             "file name".format(mode, path))
+        kwargs[path] = os.path.splitext(name)[0] + extension
     if isinstance(fileobj, str):
         fileobj = open(fileobj, 'w')
     if not hasattr(fileobj, 'write'):
         raise ValueError("fileobj should be a filename or a writable file")
-    html = fig_to_html(fig, **kwargs)
-    fileobj.write(html)
+    # The page is written as it is encoded
+    for chunk in iter_html(fig, **kwargs):
+        fileobj.write(chunk)
     fileobj.close()
 
 
-def display(fig=None, closefig=True, **kwargs):
+def display(fig=None, closefig=True, mode='base64',
+            directory='_spatplotlib', **kwargs):
     """
     Convert a Matplotlib Figure to a Leaflet map. Embed in IPython notebook.
 
@@ -126,19 +406,119 @@ def display(fig=None, closefig=True, **kwargs):
         Figure used to convert to map
     closefig : boolean, default True
         Close the current Figure
+    mode : string, default 'base64'
+        How the page of the map reaches the notebook. 'base64' embeds it in
+        the notebook, as a data URI. 'file' writes it to directory, and only
+        an iframe loading it is embedded: the Jupyter server serves the file
+        through its files/ route, so directory must be under the root
+        directory of the server. 'server' writes it to a temporary directory
+        served by a local HTTP server in the kernel, for browsers on the
+        same machine as the kernel. Pages are named by a hash of their
+        content, so displaying the same map again reuses its file.
+    directory : string, default '_spatplotlib'
+        The directory of the pages with mode='file', relative to the
+        working directory of the kernel (the directory of the notebook,
+        unless it was changed)
+
+    See fig_to_html() for description of keyword args.
     """
+    if mode not in _display_modes:
+        raise ValueError("mode must be one of {}, not {!r}"
+                         .format(_display_modes, mode))
     if fig is None:
         fig = plt.gcf()
     if closefig:
         plt.close(fig)
 
-    html = base64.b64encode(fig_to_html(fig, **kwargs).encode('utf8')).decode('utf8')
     width = '100%'
     height = int(60. * fig.get_figheight())
-    iframe_html = f"""<iframe src="data:text/html;base64,{html}" width="{width}" height="{height}"></iframe>'"""
+    if mode == 'base64':
+        html = base64.b64encode(fig_to_html(fig, **kwargs).encode('utf8'))
+        src = 'data:text/html;base64,' + html.decode('utf8')
+    elif mode == 'file':
+        name = _write_page(fig, directory, **kwargs)
+        src = _files_url(os.path.join(directory, name))
+    else:
+        directory, port = _serve_pages()
+        name = _write_page(fig, directory, **kwargs)
+        src = 'http://127.0.0.1:{}/{}'.format(port, name)
+    iframe_html = f"""<iframe src="{src}" width="{width}" height="{height}"></iframe>"""
     from IPython.display import HTML
     return HTML(iframe_html)
 
+
+def _write_page(fig, directory, **kwargs):
+    """
+    Write the page of a figure to directory, named by a hash of its
+    content, and return its file name. An existing page is kept.
+    """
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha1()
+    fd, tmp = tempfile.mkstemp(suffix='.html', dir=directory)
+    with os.fdopen(fd, 'w') as f:
+        for chunk in iter_html(fig, **kwargs):
+            f.write(chunk)
+            digest.update(_mapid_pattern.sub('map', chunk).encode('utf8'))
+    name = digest.hexdigest()[:20] + '.html'
+    path = os.path.join(directory, name)
+    if os.path.exists(path):
+        os.remove(tmp)
+    else:
+        os.replace(tmp, path)
+    return name
+
+
+def _jupyter_server():
+    """
+    (root directory, base url) of the Jupyter server running the kernel:
+    the running server whose root holds the working directory, or the
+    working directory and '/' if the servers cannot be listed
+    """
+    try:
+        from jupyter_server.serverapp import list_running_servers
+    except ImportError:
+        try:
+            from notebook.notebookapp import list_running_servers
+        except ImportError:
+            list_running_servers = list
+    cwd = os.getcwd()
+    for server in list_running_servers():
+        root = os.path.abspath(server.get('root_dir',
+                                          server.get('notebook_dir', '')))
+        if os.path.commonpath([root, cwd]) == root:
+            return root, server.get('base_url', '/')
+    return cwd, '/'
+
+
+def _files_url(path):
+    """Absolute url of a file served by the files/ route of Jupyter"""
+    root, base_url = _jupyter_server()
+    relative = os.path.relpath(os.path.abspath(path), root)
+    return '{}files/{}'.format(base_url.rstrip('/') + '/', urllib.parse.quote(
+        '/'.join(relative.split(os.sep))))
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    # Requests would otherwise be logged to the notebook
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve_pages():
+    """Return the directory and port of the local server of pages, which
+    is started on the first call"""
+    global _page_server
+    with _page_server_lock:
+        if _page_server is None:
+            directory = tempfile.mkdtemp(prefix='spatplotlib-')
+            handler = functools.partial(_QuietHandler, directory=directory)
+            server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                     handler)
+            threading.Thread(target=server.serve_forever,
+                             daemon=True).start()
+            _page_server = directory, server.server_address[1]
+        return _page_server
+
 def show(fig=None, path='_map.html', **kwargs):
     """
     Convert a Matplotlib Figure to a Leaflet map. Open in a browser
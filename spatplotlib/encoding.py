@@ -0,0 +1,152 @@
+"""
+Encodings of the GeoJSON of LeafletRenderer that are more compact, or
+faster for the browser to load, than JSON number text. The page templates
+decode them back (see htmlbase.load_data).
+"""
+import numpy as np
+
+
+def pack_buffers(gj, dtype=np.float64):
+    """
+    Move the arrays of a GeoJSON dictionary into one binary buffer
+
+    Every numeric NumPy array is replaced with a reference to its slice of
+    the buffer: {"@f": start, "n": length} for numbers, with "d": 2 for
+    (length, 2) coordinate arrays, which are decoded to lists of pairs.
+    32-bit integer arrays (e.g. quantized coordinates) are kept as such and
+    referenced with {"@i": start, "n": length}, and so are unsigned byte
+    arrays (e.g. colors) with {"@u": start, "n": length}. Other values are
+    left as they are.
+
+    Parameters
+    ----------
+    gj : dict
+        GeoJSON dictionary, as returned by LeafletRenderer.geojson()
+    dtype : numpy dtype, default float64
+        Type of the numbers in the buffer, float32 or float64
+
+    Returns
+    -------
+    The GeoJSON dictionary with references, with a "buffer" member
+    describing the buffer, and the buffer as bytes: the numbers, followed
+    by the integers and the unsigned bytes.
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError('dtype must be float32 or float64, not {}'
+                         .format(dtype))
+    floats, int32s, uint8s = [], [], []
+    sizes = {'floats': 0, 'ints': 0, 'bytes': 0}
+
+    def pack(o):
+        if isinstance(o, dict):
+            return {key: pack(value) for key, value in o.items()}
+        if isinstance(o, (list, tuple)):
+            return [pack(value) for value in o]
+        if (not isinstance(o, np.ndarray) or o.dtype.kind not in 'fiu'
+                or o.ndim > 2 or (o.ndim == 2 and o.shape[1] != 2)):
+            return o
+        if o.dtype == np.uint8:
+            ref = {"@u": sizes['bytes'], "n": o.size}
+            uint8s.append(o.ravel())
+            sizes['bytes'] += o.size
+            return ref
+        if o.dtype == np.int32:
+            ref = {"@i": sizes['ints'], "n": o.size}
+            int32s.append(o.ravel())
+            sizes['ints'] += o.size
+            return ref
+        ref = {"@f": sizes['floats'], "n": len(o)}
+        if o.ndim == 2:
+            ref["d"] = 2
+        floats.append(o.ravel())
+        sizes['floats'] += o.size
+        return ref
+
+    packed = pack(gj)
+    packed["buffer"] = {
+        "dtype": dtype.name,
+        "floats": sizes['floats'],
+        "ints": sizes['ints'],
+        "bytes": sizes['bytes'],
+    }
+    sections = [(floats, dtype.newbyteorder('<')), (int32s, '<i4'),
+                (uint8s, np.uint8)]
+    buffer = b''.join(np.concatenate(arrays or [[]]).astype(section_dtype)
+                      .tobytes() for arrays, section_dtype in sections)
+    return packed, buffer
+
+
+def quantize(gj, precision=6):
+    """
+    Quantize and delta encode the coordinates of a GeoJSON dictionary
+
+    Coordinates are snapped to a grid of 10**-precision degrees with its
+    origin at the lower left corner of their bounds, like TopoJSON. Each
+    (N, 2) coordinate array (lines, rings, marker collections, levels of
+    detail and clusters) is replaced with {"dq": [x0, y0, dx1, dy1, ...]}:
+    the grid position of its first point followed by the steps to the
+    next ones, as a flat integer array. Single points and WebGL point
+    layers keep their coordinates.
+
+    Parameters
+    ----------
+    gj : dict
+        GeoJSON dictionary, as returned by LeafletRenderer.geojson()
+    precision : int, default 6
+        Number of decimals kept
+
+    Returns
+    -------
+    The GeoJSON dictionary with quantized coordinates and a "transform"
+    member, {"scale": [sx, sy], "translate": [tx, ty]}, which decodes grid
+    positions as x * sx + tx, y * sy + ty.
+    """
+    arrays = []
+
+    def collect(o):
+        if isinstance(o, dict):
+            for value in o.values():
+                collect(value)
+        elif isinstance(o, (list, tuple)):
+            for value in o:
+                collect(value)
+        elif _is_coordinates(o):
+            arrays.append(o)
+
+    collect(gj)
+    scale = 10.0 ** -precision
+    if arrays:
+        coords = np.concatenate(arrays)
+        translate = coords.min(axis=0)
+        grid = np.round((coords - translate) / scale).astype(np.int64)
+        # Steps between consecutive points, except at the start of each
+        # array, which keeps its position
+        lengths = [len(a) for a in arrays]
+        starts = np.cumsum(lengths) - lengths
+        steps = np.diff(grid, axis=0, prepend=grid[:1])
+        steps[starts] = grid[starts]
+        if np.abs(steps).max() < 2 ** 31:
+            steps = steps.astype(np.int32)
+        encoded = iter(np.split(steps, starts[1:]))
+    else:
+        translate = np.zeros(2)
+
+    def replace(o):
+        if isinstance(o, dict):
+            return {key: replace(value) for key, value in o.items()}
+        if isinstance(o, (list, tuple)):
+            return [replace(value) for value in o]
+        if _is_coordinates(o):
+            return {"dq": next(encoded).ravel()}
+        return o
+
+    quantized = replace(gj)
+    quantized["transform"] = {"scale": [scale, scale],
+                              "translate": translate.tolist()}
+    return quantized
+
+
+def _is_coordinates(o):
+    return (isinstance(o, np.ndarray) and o.dtype.kind == 'f'
+            and o.ndim == 2 and o.shape[1] == 2 and len(o) > 0)
@@ -8,8 +8,9 @@ import warnings
 import io
 from . import utils
 
+import numpy as np
 import matplotlib
-from matplotlib import transforms, collections
+from matplotlib import transforms, collections, contour
 from matplotlib.backends.backend_agg import FigureCanvasAgg
 
 
@@ -26,11 +27,22 @@ class Exporter(object):
         If True (default), close the matplotlib figure as it is rendered. This
         is useful for when the exporter is used within the notebook, or with
         an interactive matplotlib backend.
+    draw_mode : {'layout', 'png'}
+        How the figure is drawn before it is crawled. 'layout' (default) runs
+        matplotlib's draw pass with rendering disabled, which places every
+        artist without rasterizing anything. 'png' saves the figure to a
+        throwaway PNG, which is slower but matches older versions.
     """
 
-    def __init__(self, renderer, close_mpl=True):
+    draw_modes = ('layout', 'png')
+
+    def __init__(self, renderer, close_mpl=True, draw_mode='layout'):
+        if draw_mode not in self.draw_modes:
+            raise ValueError("draw_mode must be one of {}, not {!r}"
+                             .format(self.draw_modes, draw_mode))
         self.close_mpl = close_mpl
         self.renderer = renderer
+        self.draw_mode = draw_mode
 
     def run(self, fig):
         """
@@ -41,11 +53,16 @@ class Exporter(object):
         fig : matplotlib.Figure instance
             The figure to export
         """
-        # Calling savefig executes the draw() command, putting elements
-        # in the correct place.
+        # Drawing the figure puts elements in the correct place. Only the
+        # layout is needed, so skip rasterization and the PNG encode unless
+        # asked for (or matplotlib is too old to draw without rendering).
         if fig.canvas is None:
             canvas = FigureCanvasAgg(fig)
-        fig.savefig(io.BytesIO(), format='png', dpi=fig.dpi)
+        if (self.draw_mode == 'layout'
+                and hasattr(fig, 'draw_without_rendering')):
+            fig.draw_without_rendering()
+        else:
+            fig.savefig(io.BytesIO(), format='png', dpi=fig.dpi)
         if self.close_mpl:
             import matplotlib.pyplot as plt
             plt.close(fig)
@@ -235,6 +252,12 @@ class Exporter(object):
                         force_pathtrans=None,
                         force_offsettrans=None):
         """Process a matplotlib collection and call renderer.draw_collection"""
+        if (isinstance(collection, collections.QuadMesh)
+                and self.draw_quadmesh(ax, collection, force_pathtrans)):
+            return
+        if (isinstance(collection, contour.ContourSet)
+                and self.draw_contour(ax, collection, force_pathtrans)):
+            return
         (transform, transOffset,
          offsets, paths) = collection._prepare_points()
 
@@ -260,7 +283,9 @@ class Exporter(object):
         styles = {'linewidth': collection.get_linewidths(),
                   'facecolor': collection.get_facecolors(),
                   'edgecolor': collection.get_edgecolors(),
-                  'alpha': collection._alpha,
+                  # An alpha per path is in the colors already
+                  'alpha': (collection._alpha
+                            if np.ndim(collection._alpha) == 0 else None),
                   'zorder': collection.get_zorder()}
 
         self.renderer.draw_path_collection(paths=processed_paths,
@@ -272,9 +297,88 @@ class Exporter(object):
                                            styles=styles,
                                            mplobj=collection)
 
+    def draw_contour(self, ax, contours, force_trans=None):
+        """
+        Process a matplotlib ContourSet and call renderer.draw_contour.
+        Returns False if the renderer leaves it to draw_path_collection.
+        """
+        coordinates = self.process_transform(contours.get_transform(), ax,
+                                             force_trans=force_trans)
+        paths = [utils.SVG_path(path) for path in contours.get_paths()]
+        levels = np.asarray(contours.levels, dtype=float)
+        if contours.filled:
+            # Extended bands are open below or above, to -inf or inf
+            extend = getattr(contours, 'extend', 'neither')
+            levels = np.concatenate([
+                [-np.inf] if extend in ('min', 'both') else [], levels,
+                [np.inf] if extend in ('max', 'both') else []])
+            levels = np.column_stack([levels[:-1], levels[1:]])
+        if len(paths) != len(levels):
+            return False
+
+        def cycle(values, empty):
+            values = list(values) if np.size(values) else [empty]
+            return [values[i % len(values)] for i in range(len(paths))]
+
+        styles = [{"edgecolor": utils.export_color(ec),
+                   "facecolor": utils.export_color(fc),
+                   "edgewidth": lw,
+                   "dasharray": "10,0",
+                   "alpha": contours.get_alpha(),
+                   "zorder": contours.get_zorder()}
+                  for ec, fc, lw in zip(
+                      cycle(contours.get_edgecolors(), 'none'),
+                      cycle(contours.get_facecolors(), 'none'),
+                      cycle(contours.get_linewidths(), 0))]
+        return self.renderer.draw_contour(paths=paths, levels=levels,
+                                          filled=contours.filled,
+                                          coordinates=coordinates,
+                                          styles=styles, mplobj=contours)
+
+    def draw_quadmesh(self, ax, mesh, force_trans=None):
+        """
+        Process a matplotlib QuadMesh and call renderer.draw_quadmesh.
+        Returns False if the renderer leaves it to draw_path_collection.
+        """
+        coordinates = self.process_transform(mesh.get_transform(), ax,
+                                             force_trans=force_trans)
+        values = mesh.get_array()
+        corners = mesh.get_coordinates().shape[:2]
+        cells = (corners[0] - 1, corners[1] - 1)
+        if values is None:
+            # Colored one by one, or all alike
+            values = mesh.get_facecolors()
+            if len(values) == 1:
+                values = np.broadcast_to(values, (cells[0] * cells[1], 4))
+        values = np.ma.asarray(values)
+        # Values are given by cell, or by vertex with shading 'gouraud'
+        for shape in (cells, corners):
+            count = shape[0] * shape[1]
+            if values.size == count:
+                values = values.reshape(shape)
+                break
+            if values.ndim == 2 and len(values) == count:
+                values = values.reshape(*shape, -1)
+                break
+            if values.ndim == 3 and values.shape[:2] == shape:
+                break
+        else:
+            return False
+        return self.renderer.draw_quadmesh(
+            vertices=mesh.get_coordinates(),
+            values=values,
+            coordinates=coordinates,
+            style={"alpha": mesh.get_alpha(),
+                   "zorder": mesh.get_zorder()},
+            mplobj=mesh)
+
     def draw_image(self, ax, image):
         """Process a matplotlib image object and call renderer.draw_image"""
-        self.renderer.draw_image(imdata=utils.image_to_base64(image),
+        if self.renderer.image_arrays:
+            imdata = image.get_array()
+        else:
+            imdata = utils.image_to_base64(image)
+        self.renderer.draw_image(imdata=imdata,
                                  extent=image.get_extent(),
                                  coordinates="data",
                                  style={"alpha": image.get_alpha(),
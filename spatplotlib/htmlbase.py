@@ -10,31 +10,676 @@ def format(**params):
 <body>
 <div id="map{params['mapid']}"></div>
 <script text="text/javascript">
-var map = L.map('map{params['mapid']}');
+var map = L.map('map{params['mapid']}'{map_options(**params)});
 L.tileLayer(
   "{params['tile_url']}",
   {{maxZoom:19, attribution: '{params['attribution']}'}}).addTo(map);
 var gjData = {params['geojson']};
 
-if (gjData.features.length != 0) {{
-  var gj = L.geoJson(gjData, {{
-    style: function (feature) {{
-      return feature.properties;
-    }},
-    pointToLayer: function (feature, latlng) {{
-      var icon = L.divIcon({{'html': feature.properties.html,
-        iconAnchor: [feature.properties.anchor_x,
-                     feature.properties.anchor_y],
+{add_layers(**params)}
+</script>
+</body>
+"""
+
+
+def map_options(**params):
+  """Options argument of L.map() for the 'renderer' parameter."""
+  if params.get('renderer') == 'canvas':
+    return ", {preferCanvas: true}"
+  return ""
+
+
+def icon_markers():
+  """Script drawing markers as icons."""
+  return """
+  function symbolMarker(latlng, id) {
+    return L.marker(latlng, {icon: icons[id]});
+  }"""
+
+
+def canvas_markers():
+  """Script drawing markers on the map's canvas instead of as icons."""
+  return """
+  // Markers are drawn on the canvas with the path of their symbol. They
+  // are circle markers of the symbol's radius for Leaflet's hit testing.
+  var SymbolMarker = L.CircleMarker.extend({
+    initialize: function (latlng, symbol) {
+      L.CircleMarker.prototype.initialize.call(this, latlng,
+        L.extend({radius: symbol.radius}, symbol.style));
+      this._path2d = new Path2D(symbol.path);
+    },
+    _updatePath: function () {
+      var renderer = this._renderer;
+      if (!renderer._drawing || this._empty()) {
+        return;
+      }
+      var ctx = renderer._ctx, options = this.options;
+      ctx.save();
+      ctx.translate(this._point.x, this._point.y);
+      if (options.fillColor && options.fillColor != 'none') {
+        ctx.globalAlpha = options.fillOpacity;
+        ctx.fillStyle = options.fillColor;
+        ctx.fill(this._path2d);
+      }
+      if (options.weight && options.color != 'none') {
+        ctx.globalAlpha = options.opacity;
+        ctx.lineWidth = options.weight;
+        ctx.strokeStyle = options.color;
+        ctx.stroke(this._path2d);
+      }
+      ctx.restore();
+    }
+  });
+  function symbolMarker(latlng, id) {
+    return new SymbolMarker(latlng, gjData.symbols[id]);
+  }"""
+
+
+def point_layer():
+  """Script of the WebGL layer drawing the point layers of gjData."""
+  return """
+  // Draws points as discs with WebGL, or a 2D canvas as a fallback. The
+  // canvas covers the map container and is redrawn as the map moves.
+  var vertexShader = [
+    'attribute vec2 a_position;',
+    'attribute vec4 a_color;',
+    'attribute float a_size;',
+    'uniform vec2 u_offset;',
+    'uniform float u_scale;',
+    'uniform vec2 u_size;',
+    'uniform float u_ratio;',
+    'varying vec4 v_color;',
+    'void main() {',
+    '  vec2 p = (a_position + u_offset) * u_scale / u_size;',
+    '  gl_Position = vec4(2.0 * p.x - 1.0, 1.0 - 2.0 * p.y, 0.0, 1.0);',
+    '  gl_PointSize = a_size * u_ratio;',
+    '  v_color = a_color;',
+    '}'].join('\\n');
+  var fragmentShader = [
+    'precision mediump float;',
+    'varying vec4 v_color;',
+    'void main() {',
+    '  vec2 c = 2.0 * gl_PointCoord - 1.0;',
+    '  if (dot(c, c) > 1.0) discard;',
+    '  gl_FragColor = v_color;',
+    '}'].join('\\n');
+  var gridSize = 1024;
+
+  var PointLayer = L.Layer.extend({
+    initialize: function (data) {
+      var n = data.sizes.length;
+      var x = new Float64Array(n), y = new Float64Array(n);
+      var south = 90, west = 180, north = -90, east = -180;
+      for (var i = 0; i < n; i++) {
+        var lon = data.positions[2 * i], lat = data.positions[2 * i + 1];
+        var p = L.CRS.EPSG3857.latLngToPoint(L.latLng(lat, lon), 0);
+        x[i] = p.x / 256;
+        y[i] = p.y / 256;
+        south = Math.min(south, lat);
+        north = Math.max(north, lat);
+        west = Math.min(west, lon);
+        east = Math.max(east, lon);
+      }
+      this._bounds = L.latLngBounds([south, west], [north, east]);
+      // Positions are relative to the center of the points, in Web
+      // Mercator world coordinates, to make the most of float32.
+      this._offset = L.CRS.EPSG3857.latLngToPoint(this._bounds.getCenter(), 0)
+                                    .divideBy(256);
+      this._positions = new Float32Array(2 * n);
+      for (i = 0; i < n; i++) {
+        this._positions[2 * i] = x[i] - this._offset.x;
+        this._positions[2 * i + 1] = y[i] - this._offset.y;
+      }
+      this._lonlat = data.positions;
+      this._colors = new Uint8Array(data.colors);
+      this._sizes = new Float32Array(data.sizes);
+      this._maxSize = 0;
+      for (i = 0; i < n; i++) {
+        this._maxSize = Math.max(this._maxSize, this._sizes[i]);
+      }
+      // Grid of the world for hit testing: the points of cell c are
+      // this._order[this._cellStart[c]:this._cellStart[c + 1]]
+      var cells = new Int32Array(n);
+      this._cellStart = new Int32Array(gridSize * gridSize + 1);
+      for (i = 0; i < n; i++) {
+        cells[i] = this._cell(x[i], y[i]);
+        this._cellStart[cells[i] + 1]++;
+      }
+      for (i = 0; i < gridSize * gridSize; i++) {
+        this._cellStart[i + 1] += this._cellStart[i];
+      }
+      var fill = this._cellStart.slice(0, -1);
+      this._order = new Int32Array(n);
+      for (i = 0; i < n; i++) {
+        this._order[fill[cells[i]]++] = i;
+      }
+    },
+    getBounds: function () {
+      return this._bounds;
+    },
+    onAdd: function (map) {
+      var canvas = this._canvas = L.DomUtil.create('canvas');
+      canvas.style.position = 'absolute';
+      canvas.style.left = canvas.style.top = '0';
+      canvas.style.zIndex = 450;
+      canvas.style.pointerEvents = 'none';
+      map.getContainer().appendChild(canvas);
+      var gl = canvas.getContext('webgl', {premultipliedAlpha: false});
+      if (gl) {
+        this._initGL(gl);
+      } else {
+        this._ctx = canvas.getContext('2d');
+      }
+      map.on('move zoom resize viewreset', this._redraw, this);
+      map.on('mousemove', this._hover, this);
+      map.on('click', this._click, this);
+      this._redraw();
+    },
+    onRemove: function (map) {
+      L.DomUtil.remove(this._canvas);
+      map.off('move zoom resize viewreset', this._redraw, this);
+      map.off('mousemove', this._hover, this);
+      map.off('click', this._click, this);
+    },
+    _cell: function (x, y) {
+      var cx = Math.min(Math.max(Math.floor(x * gridSize), 0), gridSize - 1);
+      var cy = Math.min(Math.max(Math.floor(y * gridSize), 0), gridSize - 1);
+      return cy * gridSize + cx;
+    },
+    _initGL: function (gl) {
+      function compile(type, source) {
+        var shader = gl.createShader(type);
+        gl.shaderSource(shader, source);
+        gl.compileShader(shader);
+        return shader;
+      }
+      var program = gl.createProgram();
+      gl.attachShader(program, compile(gl.VERTEX_SHADER, vertexShader));
+      gl.attachShader(program, compile(gl.FRAGMENT_SHADER, fragmentShader));
+      gl.linkProgram(program);
+      gl.useProgram(program);
+      function attribute(name, array, size, type, normalized) {
+        var location = gl.getAttribLocation(program, name);
+        gl.bindBuffer(gl.ARRAY_BUFFER, gl.createBuffer());
+        gl.bufferData(gl.ARRAY_BUFFER, array, gl.STATIC_DRAW);
+        gl.enableVertexAttribArray(location);
+        gl.vertexAttribPointer(location, size, type, normalized, 0, 0);
+      }
+      attribute('a_position', this._positions, 2, gl.FLOAT, false);
+      attribute('a_color', this._colors, 4, gl.UNSIGNED_BYTE, true);
+      attribute('a_size', this._sizes, 1, gl.FLOAT, false);
+      gl.enable(gl.BLEND);
+      gl.blendFunc(gl.SRC_ALPHA, gl.ONE_MINUS_SRC_ALPHA);
+      this._gl = gl;
+      this._uniforms = {};
+      ['u_offset', 'u_scale', 'u_size', 'u_ratio'].forEach(function (name) {
+        this._uniforms[name] = gl.getUniformLocation(program, name);
+      }, this);
+    },
+    // The scale of world coordinates to container pixels, and the world
+    // coordinates of the top left corner of the map container.
+    _view: function () {
+      var map = this._map, zoom = map.getZoom();
+      var scale = 256 * Math.pow(2, zoom);
+      var origin = map.project(map.containerPointToLatLng([0, 0]), zoom)
+                      .divideBy(scale);
+      return {scale: scale, origin: origin, size: map.getSize()};
+    },
+    _redraw: function () {
+      var view = this._view(), canvas = this._canvas;
+      var ratio = window.devicePixelRatio || 1;
+      if (canvas.width != view.size.x * ratio ||
+          canvas.height != view.size.y * ratio) {
+        canvas.width = view.size.x * ratio;
+        canvas.height = view.size.y * ratio;
+        canvas.style.width = view.size.x + 'px';
+        canvas.style.height = view.size.y + 'px';
+      }
+      var dx = this._offset.x - view.origin.x, dy = this._offset.y - view.origin.y;
+      var n = this._sizes.length;
+      if (this._gl) {
+        var gl = this._gl, u = this._uniforms;
+        gl.viewport(0, 0, canvas.width, canvas.height);
+        gl.clearColor(0, 0, 0, 0);
+        gl.clear(gl.COLOR_BUFFER_BIT);
+        gl.uniform2f(u.u_offset, dx, dy);
+        gl.uniform1f(u.u_scale, view.scale);
+        gl.uniform2f(u.u_size, view.size.x, view.size.y);
+        gl.uniform1f(u.u_ratio, ratio);
+        gl.drawArrays(gl.POINTS, 0, n);
+        return;
+      }
+      var ctx = this._ctx, c = this._colors;
+      ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+      ctx.clearRect(0, 0, view.size.x, view.size.y);
+      for (var i = 0; i < n; i++) {
+        var px = (this._positions[2 * i] + dx) * view.scale;
+        var py = (this._positions[2 * i + 1] + dy) * view.scale;
+        var r = this._sizes[i] / 2;
+        if (px < -r || py < -r || px > view.size.x + r || py > view.size.y + r) {
+          continue;
+        }
+        ctx.fillStyle = 'rgba(' + c[4 * i] + ',' + c[4 * i + 1] + ',' +
+                        c[4 * i + 2] + ',' + c[4 * i + 3] / 255 + ')';
+        ctx.beginPath();
+        ctx.arc(px, py, r, 0, 2 * Math.PI);
+        ctx.fill();
+      }
+    },
+    // Index of the topmost point under a container point, or -1
+    _hit: function (containerPoint) {
+      var view = this._view();
+      var x = view.origin.x + containerPoint.x / view.scale;
+      var y = view.origin.y + containerPoint.y / view.scale;
+      var r = this._maxSize / 2 / view.scale;
+      var c0 = this._cell(x - r, y - r), c1 = this._cell(x + r, y + r);
+      var x0 = c0 % gridSize, x1 = c1 % gridSize;
+      var best = -1;
+      for (var cy = Math.floor(c0 / gridSize); cy <= Math.floor(c1 / gridSize); cy++) {
+        for (var cell = cy * gridSize + x0; cell <= cy * gridSize + x1; cell++) {
+          for (var k = this._cellStart[cell]; k < this._cellStart[cell + 1]; k++) {
+            var i = this._order[k];
+            var d = Math.hypot(this._positions[2 * i] + this._offset.x - x,
+                               this._positions[2 * i + 1] + this._offset.y - y);
+            if (d * view.scale <= this._sizes[i] / 2 && i > best) {
+              best = i;
+            }
+          }
+        }
+      }
+      return best;
+    },
+    _hover: function (e) {
+      var i = this._hit(e.containerPoint);
+      this._map.getContainer().style.cursor = i >= 0 ? 'pointer' : '';
+    },
+    _click: function (e) {
+      var i = this._hit(e.containerPoint);
+      if (i < 0) {
+        return;
+      }
+      var latlng = L.latLng(this._lonlat[2 * i + 1], this._lonlat[2 * i]);
+      L.popup().setLatLng(latlng)
+        .setContent(latlng.lat.toFixed(6) + ', ' + latlng.lng.toFixed(6))
+        .openOn(this._map);
+      this.fire('click', {index: i, latlng: latlng});
+    }
+  });"""
+
+
+def fetch_data():
+  """Script of fetchData(gjData), a promise of the data fetched from
+  gjData.url, decompressed if gjData.compressed. The map is fitted to
+  gjData.bbox meanwhile, so its tiles load first."""
+  return """function fetchData(gjData) {
+  if (gjData.bbox) {
+    map.fitBounds([[gjData.bbox[1], gjData.bbox[0]],
+                   [gjData.bbox[3], gjData.bbox[2]]]);
+  } else {
+    map.setView([0, 0], 1);
+  }
+  return fetch(gjData.url).then(function (response) {
+    if (!response.ok) {
+      throw new Error(gjData.url + ': ' + response.status);
+    }
+    return response.arrayBuffer();
+  }).then(function (data) {
+    // Servers sending the file with a Content-Encoding already
+    // decompressed it into the JSON object
+    if (gjData.compressed && new Uint8Array(data)[0] != 0x7b) {
+      return inflateJSON(data, gjData.compressed);
+    }
+    return JSON.parse(new TextDecoder().decode(data));
+  });
+}
+"""
+
+
+def inflate_data():
+  """Script of inflateData(gjData), a promise of the data compressed and
+  base64 encoded in gjData.data (see fig_to_html), and of
+  inflateJSON(data, format), which decompresses and parses JSON."""
+  return """function inflateJSON(data, format) {
+  var stream = new Blob([data]).stream()
+    .pipeThrough(new DecompressionStream(format));
+  return new Response(stream).json();
+}
+function inflateData(gjData) {
+  var text = atob(gjData.data);
+  var bytes = new Uint8Array(text.length);
+  for (var i = 0; i < text.length; i++) {
+    bytes[i] = text.charCodeAt(i);
+  }
+  return inflateJSON(bytes, gjData.compressed);
+}
+"""
+
+
+def load_data():
+  """Script of loadData(gjData), a promise of gjData with its arrays
+  unpacked from the binary buffer (see encoding.pack_buffers)."""
+  return """function loadData(gjData) {
+  var buffer = gjData.buffer;
+  var loaded;
+  if (buffer.url) {
+    loaded = fetch(buffer.url).then(function (response) {
+      return response.arrayBuffer();
+    });
+  } else {
+    var text = atob(buffer.data);
+    var bytes = new Uint8Array(text.length);
+    for (var i = 0; i < text.length; i++) {
+      bytes[i] = text.charCodeAt(i);
+    }
+    loaded = Promise.resolve(bytes.buffer);
+  }
+  return loaded.then(function (data) {
+    var Floats = buffer.dtype == 'float32' ? Float32Array : Float64Array;
+    var offset = buffer.floats * Floats.BYTES_PER_ELEMENT;
+    var floats = new Floats(data, 0, buffer.floats);
+    var int32s = new Int32Array(data, offset, buffer.ints);
+    var uint8s = new Uint8Array(data, offset + 4 * buffer.ints, buffer.bytes);
+    function unpack(o) {
+      if (Array.isArray(o)) {
+        return o.map(unpack);
+      }
+      if (o === null || typeof o != 'object') {
+        return o;
+      }
+      if ('@u' in o) {
+        return uint8s.subarray(o['@u'], o['@u'] + o.n);
+      }
+      if ('@i' in o) {
+        return int32s.subarray(o['@i'], o['@i'] + o.n);
+      }
+      if ('@f' in o && o.d == 2) {
+        var pairs = new Array(o.n);
+        for (var i = 0; i < o.n; i++) {
+          pairs[i] = [floats[o['@f'] + 2 * i], floats[o['@f'] + 2 * i + 1]];
+        }
+        return pairs;
+      }
+      if ('@f' in o) {
+        return floats.subarray(o['@f'], o['@f'] + o.n);
+      }
+      for (var key in o) {
+        o[key] = unpack(o[key]);
+      }
+      return o;
+    }
+    return unpack(gjData);
+  });
+}
+"""
+
+
+def dequantize():
+  """Script of dequantize(gjData), which decodes the coordinates of gjData
+  quantized by encoding.quantize."""
+  return """function dequantize(gjData) {
+  var scale = gjData.transform.scale, translate = gjData.transform.translate;
+  function decode(o) {
+    if (Array.isArray(o)) {
+      return o.map(decode);
+    }
+    if (o === null || typeof o != 'object' || ArrayBuffer.isView(o)) {
+      return o;
+    }
+    if ('dq' in o) {
+      var dq = o.dq, pairs = new Array(dq.length / 2), x = 0, y = 0;
+      for (var i = 0; i < pairs.length; i++) {
+        x += dq[2 * i];
+        y += dq[2 * i + 1];
+        pairs[i] = [x * scale[0] + translate[0], y * scale[1] + translate[1]];
+      }
+      return pairs;
+    }
+    for (var key in o) {
+      o[key] = decode(o[key]);
+    }
+    return o;
+  }
+  return decode(gjData);
+}
+"""
+
+
+def from_topology():
+  """Script of fromTopology(topo), which converts a topology written by
+  topojson.topology back to GeoJSON, stitching the rings from their arcs."""
+  return """function fromTopology(topo) {
+  var transform = topo.transform;
+  // Positions are lists of pairs, or flat arrays from the binary buffer
+  function pairs(a) {
+    if (a.length == 0 || typeof a[0] != 'number') {
+      return Array.from(a, function (c) { return [c[0], c[1]]; });
+    }
+    var out = new Array(a.length / 2);
+    for (var i = 0; i < out.length; i++) {
+      out[i] = [a[2 * i], a[2 * i + 1]];
+    }
+    return out;
+  }
+  function position(c) {
+    return [c[0] * transform.scale[0] + transform.translate[0],
+            c[1] * transform.scale[1] + transform.translate[1]];
+  }
+  var arcs = topo.arcs.map(function (arc) {
+    arc = pairs(arc);
+    if (transform) {
+      // Arcs are delta encoded
+      for (var i = 1; i < arc.length; i++) {
+        arc[i] = [arc[i - 1][0] + arc[i][0], arc[i - 1][1] + arc[i][1]];
+      }
+      arc = arc.map(position);
+    }
+    return arc;
+  });
+  function stitch(refs) {
+    var coords = [];
+    for (var i = 0; i < refs.length; i++) {
+      var r = refs[i];
+      var arc = r < 0 ? arcs[~r].slice().reverse() : arcs[r];
+      // Consecutive arcs share their junction
+      for (var k = coords.length ? 1 : 0; k < arc.length; k++) {
+        coords.push(arc[k]);
+      }
+    }
+    return coords;
+  }
+  var features = topo.objects.figure.geometries.map(function (g) {
+    var coordinates;
+    if (g.type == 'Polygon' || g.type == 'MultiLineString') {
+      coordinates = g.arcs.map(stitch);
+    } else if (g.type == 'MultiPolygon') {
+      coordinates = g.arcs.map(function (p) { return p.map(stitch); });
+    } else if (g.type == 'LineString') {
+      coordinates = stitch(g.arcs);
+    } else {
+      coordinates = pairs(g.coordinates);
+      if (transform) {
+        coordinates = coordinates.map(position);
+      }
+      if (g.type == 'Point') {
+        coordinates = coordinates[0];
+      }
+    }
+    return {type: 'Feature', properties: g.properties,
+            geometry: {type: g.type, coordinates: coordinates}};
+  });
+  return {type: 'FeatureCollection', features: features,
+          symbols: topo.symbols, points: topo.points, images: topo.images};
+}
+"""
+
+
+def add_layers(**params):
+  """Script adding the features of gjData to map. Shared by the templates."""
+  # Decoders of the encodings of gjData, in the order they are undone
+  decoders = []
+  call = 'Promise.resolve(gjData)'
+  if params.get('compress'):
+    decoders.append(inflate_data())
+  if params.get('data') == 'sidecar':
+    decoders.append(fetch_data())
+    call = 'fetchData(gjData)'
+  elif params.get('compress'):
+    call = 'inflateData(gjData)'
+  if params.get('binary'):
+    decoders.append(load_data())
+    if call == 'Promise.resolve(gjData)':
+      call = 'loadData(gjData)'
+    else:
+      call += '.then(loadData)'
+  if params.get('topojson'):
+    # Quantized topologies are decoded along with their arcs
+    decoders.append(from_topology())
+    call += '.then(fromTopology)'
+  elif params.get('quantize'):
+    decoders.append(dequantize())
+    call += '.then(dequantize)'
+  if decoders:
+    call += '.then(addLayers);'
+  else:
+    call = 'addLayers(gjData);'
+  return f"""{''.join(decoders)}function addLayers(gjData) {{
+  if (gjData.features.length != 0 || (gjData.points || []).length != 0 ||
+      (gjData.images || []).length != 0) {{
+    function markerIcon(symbol) {{
+      return L.divIcon({{'html': symbol.html,
+        iconAnchor: [symbol.anchor_x, symbol.anchor_y],
           className: 'empty'}});  // What can I do about empty?
-      return L.marker(latlng, {{icon: icon}});
     }}
-  }});
+    // Markers reference their icon by id in the shared symbol table
+    var icons = (gjData.symbols || []).map(markerIcon);
+{canvas_markers() if params.get('renderer') == 'canvas' else icon_markers()}
+{point_layer() if params.get('points') == 'webgl' else ''}
+
+    var gj = L.geoJson(null, {{
+      style: function (feature) {{
+        return feature.properties;
+      }},
+      pointToLayer: function (feature, latlng) {{
+        return symbolMarker(latlng, feature.properties.symbol);
+      }}
+    }});
+
+    var clustered = [];
+    gjData.features.forEach(function (feature) {{
+      if (feature.clusters) {{
+        clustered.push(feature);
+      }} else if (feature.geometry.type == 'MultiPoint' && feature.properties.symbol) {{
+        // Marker collection: one symbol id per point
+        var symbol = feature.properties.symbol;
+        feature.geometry.coordinates.forEach(function (c, i) {{
+          gj.addLayer(symbolMarker([c[1], c[0]], symbol[i]));
+        }});
+      }} else {{
+        gj.addData(feature);
+      }}
+    }});
+
+    // Features with levels of detail show the coarsest level whose maxzoom
+    // is not exceeded, and their full geometry above that.
+    var lodLayers = [];
+    gj.eachLayer(function (layer) {{
+      if (layer.feature && layer.feature.lod) {{
+        lodLayers.push(layer);
+      }}
+    }});
+    // Levels of nesting of the positions of the geometries
+    var lodDepth = {{LineString: 0, Polygon: 1, MultiLineString: 1,
+                    MultiPolygon: 2}};
+    function updateLod() {{
+      var zoom = map.getZoom();
+      lodLayers.forEach(function (layer) {{
+        var feature = layer.feature;
+        var coords = feature.geometry.coordinates;
+        for (var i = 0; i < feature.lod.length && zoom <= feature.lod[i].maxzoom; i++) {{
+          coords = feature.lod[i].coordinates;
+        }}
+        if (coords !== layer._lodCoords) {{
+          layer._lodCoords = coords;
+          layer.setLatLngs(L.GeoJSON.coordsToLatLngs(
+            coords, lodDepth[feature.geometry.type]));
+        }}
+      }});
+    }}
+
+    // Clustered markers show the clusters of the current zoom level, or the
+    // markers themselves past the last level. Only those in view are added.
+    var clusterLayer = L.layerGroup();
+    function clusterIcon(count, color) {{
+      var size = count > 1 ? 24 + 8 * Math.floor(Math.log10(count)) : 10;
+      return L.divIcon({{'html': '<div style="width:' + size + 'px;height:' +
+          size + 'px;line-height:' + size + 'px;border-radius:50%;' +
+          'text-align:center;font:11px sans-serif;opacity:0.8;background:#' +
+          ('00000' + color.toString(16)).slice(-6) + '">' +
+          (count > 1 ? count : '') + '</div>',
+        iconSize: [size, size],
+        className: 'empty'}});
+    }}
+    function updateClusters() {{
+      var zoom = Math.floor(map.getZoom());
+      var view = map.getBounds().pad(0.2);
+      var south = view.getSouth(), north = view.getNorth();
+      var west = view.getWest(), east = view.getEast();
+      function inView(c) {{
+        return c[1] >= south && c[1] <= north && c[0] >= west && c[0] <= east;
+      }}
+      clusterLayer.clearLayers();
+      clustered.forEach(function (feature) {{
+        var level = feature.clusters[zoom];
+        if (level) {{
+          level.coordinates.forEach(function (c, i) {{
+            if (!inView(c)) return;
+            var marker = L.marker([c[1], c[0]],
+              {{icon: clusterIcon(level.count[i], level.color[i])}});
+            if (level.count[i] > 1) {{
+              marker.on('click', function () {{
+                map.setView([c[1], c[0]], zoom + 1);
+              }});
+            }}
+            clusterLayer.addLayer(marker);
+          }});
+        }} else {{
+          var symbol = feature.properties.symbol;
+          feature.geometry.coordinates.forEach(function (c, i) {{
+            if (inView(c)) {{
+              clusterLayer.addLayer(symbolMarker([c[1], c[0]], symbol[i]));
+            }}
+          }});
+        }}
+      }});
+    }}
 
-  gj.addTo(map);
-  map.fitBounds(gj.getBounds());
-}} else {{
-  map.setView([0, 0], 1);
+    // Images are added first, under the features
+    var bounds = L.latLngBounds([]);
+    (gjData.images || []).forEach(function (image) {{
+      bounds.extend(L.imageOverlay(image.url, image.bounds,
+        {{opacity: image.opacity}}).addTo(map).getBounds());
+    }});
+    gj.addTo(map);
+    bounds.extend(gj.getBounds());
+    clustered.forEach(function (feature) {{
+      feature.geometry.coordinates.forEach(function (c) {{
+        bounds.extend([c[1], c[0]]);
+      }});
+    }});
+    (gjData.points || []).forEach(function (data) {{
+      bounds.extend(new PointLayer(data).addTo(map).getBounds());
+    }});
+    if (clustered.length) {{
+      clusterLayer.addTo(map);
+      map.on('moveend', updateClusters);
+    }}
+    map.fitBounds(bounds);
+    if (lodLayers.length) {{
+      map.on('zoomend', updateLod);
+      updateLod();
+    }}
+  }} else {{
+    map.setView([0, 0], 1);
+  }}
 }}
-</script>
-</body>
-"""
+{call}"""
@@ -1,3 +1,6 @@
+from . import htmlbase
+
+
 def format(**params):
   return f"""<head>
   {chr(10).join([l.render(embedded=params['embed_links']) for l in params['links']])}
@@ -20,31 +23,13 @@ def format(**params):
 <div id="map{params['mapid']}"></div>
 <script text="text/javascript">
 func{params['mapid']} = function() {{
-  var map = L.map('map{params['mapid']}');
+  var map = L.map('map{params['mapid']}'{htmlbase.map_options(**params)});
   L.tileLayer(
     "{params['tile_url']}",
     {{maxZoom:19, attribution: '{params['attribution']}'}}).addTo(map);
   var gjData = {params['geojson']};
-  
-  if (gjData.features.length != 0) {{
-    var gj = L.geoJson(gjData, {{
-      style: function (feature) {{
-        return feature.properties;
-      }},
-      pointToLayer: function (feature, latlng) {{
-        var icon = L.divIcon({{'html': feature.properties.html,
-          iconAnchor: [feature.properties.anchor_x,
-                       feature.properties.anchor_y],
-            className: 'empty'}});  // What can I do about empty?
-        return L.marker(latlng, {{icon: icon}});
-      }}
-    }});
-  
-    gj.addTo(map);
-    map.fitBounds(gj.getBounds());
-  }} else {{
-    map.setView([0, 0], 1);
-  }}
+
+{htmlbase.add_layers(**params)}
 }}
 setTimeout(function() {{ func{params['mapid']}() }}, 2000);
 </script>
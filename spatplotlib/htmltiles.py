@@ -0,0 +1,141 @@
+def format(**params):
+  """Viewer page for a directory of tiles written by fig_to_tiles()."""
+  return f"""<head>
+  {chr(10).join([l.render(embedded=params['embed_links']) for l in params['links']])}
+  <style>
+    #map{params['mapid']} {{
+      height:100%;
+    }}
+  </style>
+</head>
+<body>
+<div id="map{params['mapid']}"></div>
+<script text="text/javascript">
+var map = L.map('map{params['mapid']}');
+L.tileLayer(
+  "{params['tile_url']}",
+  {{maxZoom:19, attribution: '{params['attribution']}'}}).addTo(map);
+var meta = {params['meta']};
+
+// Marker icons are drawn onto the tiles as images
+var icons = meta.symbols.map(function (symbol) {{
+  var image = new Image();
+  image.src = 'data:image/svg+xml;charset=utf-8,' + encodeURIComponent(symbol.html);
+  return {{image: image, x: symbol.anchor_x, y: symbol.anchor_y}};
+}});
+var iconsLoaded = Promise.all(icons.map(function (icon) {{
+  return new Promise(function (resolve) {{
+    icon.image.onload = icon.image.onerror = resolve;
+  }});
+}}));
+
+function project(c, scale, origin) {{
+  var lat = Math.max(Math.min(c[1], 85.0511287798), -85.0511287798) * Math.PI / 180;
+  return [(c[0] + 180) / 360 * scale - origin.x,
+          (1 - Math.log(Math.tan(lat) + 1 / Math.cos(lat)) / Math.PI) / 2 * scale - origin.y];
+}}
+
+function drawFeature(ctx, feature, scale, origin) {{
+  var geometry = feature.geometry;
+  var style = feature.properties;
+  if (geometry.type == 'MultiPoint') {{
+    geometry.coordinates.forEach(function (c, i) {{
+      var icon = icons[style.symbol[i]];
+      var p = project(c, scale, origin);
+      ctx.drawImage(icon.image, p[0] - icon.x, p[1] - icon.y);
+    }});
+    return;
+  }}
+  var polygons = geometry.type == 'MultiPolygon' ? geometry.coordinates
+                                                 : [geometry.coordinates];
+  ctx.beginPath();
+  polygons.forEach(function (parts) {{
+    parts.forEach(function (part) {{
+      part.forEach(function (c, i) {{
+        var p = project(c, scale, origin);
+        if (i == 0) {{
+          ctx.moveTo(p[0], p[1]);
+        }} else {{
+          ctx.lineTo(p[0], p[1]);
+        }}
+      }});
+      if (geometry.type == 'MultiPolygon') {{
+        ctx.closePath();
+      }}
+    }});
+  }});
+  if (style.fillColor) {{
+    ctx.globalAlpha = style.fillOpacity;
+    ctx.fillStyle = style.fillColor;
+    ctx.fill('evenodd');
+  }}
+  // Polygon edges were clipped along the tile buffer, where the buffer
+  // keeps them out of sight.
+  if (style.weight > 0 && style.color != 'none') {{
+    ctx.globalAlpha = style.opacity;
+    ctx.strokeStyle = style.color;
+    ctx.lineWidth = style.weight;
+    ctx.setLineDash(style.dashArray ? style.dashArray.split(',').map(Number) : []);
+    ctx.stroke();
+  }}
+}}
+
+var VectorTiles = L.GridLayer.extend({{
+  createTile: function (coords, done) {{
+    var tile = document.createElement('canvas');
+    var size = this.getTileSize();
+    tile.width = size.x;
+    tile.height = size.y;
+    iconsLoaded
+      .then(function () {{
+        return fetch(coords.z + '/' + coords.x + '/' + coords.y + '.geojson');
+      }})
+      .then(function (response) {{
+        // Tiles without features are not written
+        return response.ok ? response.json() : {{features: []}};
+      }})
+      .then(function (data) {{
+        var ctx = tile.getContext('2d');
+        ctx.lineCap = 'round';
+        ctx.lineJoin = 'round';
+        var scale = size.x * Math.pow(2, coords.z);
+        var origin = {{x: coords.x * size.x, y: coords.y * size.y}};
+        data.features.forEach(function (feature) {{
+          drawFeature(ctx, feature, scale, origin);
+        }});
+        done(null, tile);
+      }})
+      .catch(function (error) {{
+        done(error, tile);
+      }});
+    return tile;
+  }}
+}});
+
+// Images are tiled on their own, under the features
+meta.images.forEach(function (image) {{
+  L.tileLayer(image.url, {{
+    minNativeZoom: image.minzoom,
+    maxNativeZoom: image.maxzoom,
+    maxZoom: 19,
+    opacity: image.opacity,
+    bounds: [[image.bounds[1], image.bounds[0]],
+             [image.bounds[3], image.bounds[2]]]
+  }}).addTo(map);
+}});
+
+new VectorTiles({{
+  minNativeZoom: meta.minzoom,
+  maxNativeZoom: meta.maxzoom,
+  maxZoom: 19
+}}).addTo(map);
+
+if (meta.bounds) {{
+  map.fitBounds([[meta.bounds[1], meta.bounds[0]],
+                 [meta.bounds[3], meta.bounds[2]]]);
+}} else {{
+  map.setView([0, 0], 1);
+}}
+</script>
+</body>
+"""
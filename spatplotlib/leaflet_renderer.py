@@ -1,41 +1,111 @@
 from __future__ import absolute_import
 
-from functools import partial
+from functools import lru_cache
+import re
 
 from . import renderer
+from . import rasters
 import numpy as np
+from matplotlib import transforms
+from matplotlib.colors import to_rgba
 
-from .utils import iter_rings
+from .utils import (iter_rings, export_color, simplify_rings, web_mercator,
+                    web_mercator_inverse, cluster_points, split_polygons)
 
 _marker_inflation = 1.25
+_transformer_cache_size = 32
+# Finest zoom level at which marker clusters are computed
+_cluster_maxzoom = 16
+_rgb_weights = np.array([65536, 256, 1])
+# Meshes of more cells than this are drawn as rasters, not polygons
+_mesh_polygons = 4096
 
 class LeafletRenderer(renderer.Renderer):
-    def __init__(self, crs=None, epsg=None):
+    point_modes = ('markers', 'webgl')
+    image_arrays = True
+
+    def __init__(self, crs=None, epsg=None, simplify=None, lod=None,
+                 cluster=None, points='markers'):
         if crs is not None and epsg is not None:
             raise ValueError('crs and epsg cannot both be specified')
+        if points not in self.point_modes:
+            raise ValueError("points must be one of {}, not {!r}"
+                             .format(self.point_modes, points))
 
         if epsg is not None:
             crs = _crs_from_epsg(epsg)
         if crs is not None:
-            import pyproj
-            crs_out = _crs_from_epsg(4326)
-            proj_in = pyproj.Proj(preserve_units=True, **crs)
-            proj_out = pyproj.Proj(preserve_units=True, **crs_out)
-            self.transformfunc = partial(pyproj.transform, proj_in, proj_out)
+            self.crs_key = _crs_key(crs)
+            self.transformer = _cached_transformer(self.crs_key)
         else:
-            self.transformfunc = None
+            self.crs_key = None
+            self.transformer = None
+
+        self.simplify = simplify
+        self.lod = lod
+        self.cluster = cluster
+        self.points = points
+        self._tolerance = 0
+        self._lod_tolerance = 0
+        self._zoom = None
 
         self._features = []
+        self._symbols = []
+        self._symbol_ids = {}
+        self._point_layers = []
+        # Images and meshes, as rasters (see rasters.raster)
+        self.rasters = []
 
 
-    def geojson(self):
+    def geojson(self, images=True):
+        """
+        Return the GeoJSON dictionary of what was drawn. Images are in its
+        "images" member as image overlays, unless images is False.
+
+        """
         fc = {
             "type": "FeatureCollection",
             "features": self._features,
+            "symbols": self._symbols,
         }
+        if self.points == 'webgl':
+            fc["points"] = self._point_layers
+        if images and self.rasters:
+            overlays = map(rasters.image_overlay, self.rasters)
+            fc["images"] = [o for o in overlays if o is not None]
         return fc
 
 
+    def open_axes(self, ax, props):
+        if self.simplify or self.lod:
+            # Tolerances are given in figure pixels: find the data units
+            # covered by one pixel of these axes.
+            extent = ax.get_window_extent()
+            (x0, x1), (y0, y1) = props['xlim'], props['ylim']
+            per_pixel = min(abs(x1 - x0) / extent.width,
+                            abs(y1 - y0) / extent.height)
+            self._tolerance = (self.simplify or 0) * per_pixel
+            self._lod_tolerance = (self.simplify or 1) * per_pixel
+
+            # The Leaflet zoom level at which a screen pixel is a figure
+            # pixel: the world is 256 * 2**zoom pixels wide.
+            lon = self._transform([[x0, (y0 + y1) / 2],
+                                   [x1, (y0 + y1) / 2]])[:, 0]
+            if lon[1] != lon[0]:
+                self._zoom = np.log2(360 * extent.width
+                                     / (256 * abs(lon[1] - lon[0])))
+
+    def _transform(self, data):
+        """
+        Reproject an (N, 2) array of coordinates to lon/lat in a single call.
+
+        """
+        data = np.ascontiguousarray(data, dtype=float)
+        if self.transformer is None:
+            return data
+        x, y = self.transformer.transform(data[:, 0], data[:, 1])
+        return np.column_stack([x, y])
+
     def _convert_style(self, style):
         leaflet_style = {
             'color': style['edgecolor'],
@@ -80,51 +150,60 @@ class LeafletRenderer(renderer.Renderer):
         return ' '.join(gen_path_elements(pathcodes, data))
 
 
-    def draw_path(self, data, coordinates, pathcodes, style,
-                  offset=None, offset_coordinates="data", mplobj=None):
-        properties = self._convert_style(style)
-        if coordinates == 'points' or coordinates == 'display':
-            # Flip the points about y-axis to align with SVG coordinate
-            # system.
-            path_points = data.copy()
-            path_points[:,1] *= -1
-            if offset_coordinates != 'data':
-                pass  # Don't know how to work with this yet
-            if self.transformfunc:
-                coords = self.transformfunc(*offset)
-            else:
-                coords = list(offset)
-            geometry_type = 'Point'
-
-            # Find the size of the path, and increase by inflation
-            mx = np.max(path_points, axis=0)
-            mn = np.min(path_points, axis=0)
-
-            center = mn + (mx - mn) / 2.0
-            size = np.ceil(_marker_inflation * (mx - mn))
-            corner = center - size / 2.0
-            path = self._svg_path(pathcodes, path_points)
-            style = self._convert_style_svg(style)
-            styleitems = [str(k) + '="' + str(v) + '"' for k, v in style.items()]
-            svg = f"""<svg width="{size[0]}px" height="{size[1]}px" viewBox="{corner[0]} {corner[1]} {size[0]} {size[1]}" xmlns="http://www.w3.org/2000/svg" version="1.1">  <path d="{path}" {' '.join(styleitems)}/></svg>"""
-            properties = {'html': svg,
-                          'anchor_x': -corner[0],
-                          'anchor_y': -corner[1]}
-        else:
-            if self.transformfunc:
-                data = [self.transformfunc(*c) for c in data]
-            else:
-                data = [c.tolist() for c in data]
-            rings = list(iter_rings(data, pathcodes))
+    def _draw_marker(self, data, pathcodes, style, lonlat):
+        """
+        Add a Point feature at lon/lat drawing the path data as an SVG icon.
 
-            if style['facecolor'] != 'none':
-                # It's a polygon
-                geometry_type = 'Polygon'
-                coords = rings
-            else:
-                geometry_type = 'LineString'
-                coords = rings[0]
+        """
+        self._add_feature('Point', lonlat,
+                          {'symbol': self._symbol(data, pathcodes, style)})
+
+    def _symbol(self, data, pathcodes, style):
+        """
+        Return the id of the marker icon in the symbol table, adding it if
+        this path and style have not been seen before.
 
+        """
+        key = (tuple(pathcodes), data.shape, data.tobytes(),
+               tuple(self._convert_style_svg(style).items()))
+        if key not in self._symbol_ids:
+            self._symbol_ids[key] = len(self._symbols)
+            self._symbols.append(self._marker_icon(data, pathcodes, style))
+        return self._symbol_ids[key]
+
+    def _marker_icon(self, data, pathcodes, style):
+        """
+        Return the html and anchor of the SVG icon drawing a marker path,
+        and for drawing it on a canvas, the path relative to the anchor, its
+        radius and its Leaflet style.
+
+        """
+        # Flip the points about y-axis to align with SVG coordinate
+        # system.
+        path_points = data.copy()
+        path_points[:,1] *= -1
+
+        # Find the size of the path, and increase by inflation
+        mx = np.max(path_points, axis=0)
+        mn = np.min(path_points, axis=0)
+
+        center = mn + (mx - mn) / 2.0
+        size = np.ceil(_marker_inflation * (mx - mn))
+        corner = center - size / 2.0
+        path = self._svg_path(pathcodes, path_points)
+        leaflet_style = self._convert_style(style)
+        style = self._convert_style_svg(style)
+        styleitems = [str(k) + '="' + str(v) + '"' for k, v in style.items()]
+        svg = f"""<svg width="{size[0]}px" height="{size[1]}px" viewBox="{corner[0]} {corner[1]} {size[0]} {size[1]}" xmlns="http://www.w3.org/2000/svg" version="1.1">  <path d="{path}" {' '.join(styleitems)}/></svg>"""
+        radius = _marker_radius(path_points, style['stroke-width'])
+        return {'html': svg,
+                'anchor_x': -corner[0],
+                'anchor_y': -corner[1],
+                'path': path,
+                'radius': radius,
+                'style': leaflet_style}
+
+    def _add_feature(self, geometry_type, coords, properties, **members):
         feature = {
             "type": "Feature",
             "geometry": {
@@ -133,9 +212,279 @@ class LeafletRenderer(renderer.Renderer):
             },
             "properties": properties
         }
+        feature.update(members)
 
         self._features.append(feature)
 
+    def draw_path(self, data, coordinates, pathcodes, style,
+                  offset=None, offset_coordinates="data", mplobj=None):
+        if coordinates == 'points' or coordinates == 'display':
+            if offset_coordinates != 'data':
+                pass  # Don't know how to work with this yet
+            lonlat = self._transform(np.atleast_2d(offset))[0]
+            self._draw_marker(data, pathcodes, style, lonlat)
+            return
+
+        properties = self._convert_style(style)
+        # It's a polygon if it is filled
+        polygon = style['facecolor'] != 'none'
+        rings = list(iter_rings(data, pathcodes))
+        self._add_parts([rings] if polygon else [rings[:1]], polygon,
+                        properties, multi=False,
+                        simplify=coordinates == 'data')
+
+    def _add_parts(self, parts, polygon, properties, multi, simplify):
+        """
+        Add a feature made of parts: lists of rings (a shell and its holes)
+        if polygon, else lists of one line. It is a MultiPolygon or a
+        MultiLineString if multi, else a Polygon or a LineString of the
+        first part. Parts in data coordinates (simplify) are simplified and
+        given levels of detail, dropping those that collapse.
+
+        """
+        parts = [part for part in parts if part]
+        if self.simplify and simplify:
+            parts = [rings for rings in (
+                simplify_rings(part, polygon, self._tolerance)
+                for part in parts) if rings]
+        if not parts:
+            return
+
+        levels, maxzooms = [parts], []
+        if self.lod and simplify and self._zoom is not None:
+            for i in range(1, self.lod):
+                if not levels[-1]:
+                    break
+                tolerance = self._lod_tolerance * 2 ** i
+                coarser = [rings for rings in (
+                    simplify_rings(part, polygon, tolerance)
+                    for part in levels[-1]) if rings]
+                if _ring_lengths(coarser) == _ring_lengths(levels[-1]):
+                    # Nothing left to remove at this tolerance
+                    continue
+                levels.append(coarser)
+                maxzooms.append(int(np.floor(self._zoom - i)))
+
+        # Reproject the rings of every level in one call
+        rings = [ring for level in levels for part in level for ring in part]
+        data = self._transform(np.concatenate(rings))
+        flat = iter(np.split(data, np.cumsum(list(map(len, rings)))[:-1]))
+        levels = [[[next(flat) for _ in part] for part in level]
+                  for level in levels]
+        if not polygon:
+            levels = [[part[0] for part in level] for level in levels]
+        if not multi:
+            levels = [level[0] if level else [] for level in levels]
+
+        lod = [{'maxzoom': maxzoom, 'coordinates': coords}
+               for maxzoom, coords in zip(maxzooms, levels[1:])]
+        geometry_type = 'Polygon' if polygon else 'LineString'
+        if multi:
+            geometry_type = 'Multi' + geometry_type
+        self._add_feature(geometry_type, levels[0], properties,
+                          **({'lod': lod} if lod else {}))
+
+    def draw_contour(self, paths, levels, filled, coordinates, styles,
+                     mplobj=None):
+        """
+        Draw each level of a contour set as one feature: the MultiPolygon
+        of a band of contourf, or the MultiLineString of the lines of
+        contour. Its 'level' property is the level of the lines, or the
+        [lower, upper] levels of the band, null for the open side of the
+        bands of extend.
+
+        """
+        if coordinates != 'data':
+            return False
+        for (data, pathcodes), level, style in zip(paths, levels, styles):
+            rings = list(iter_rings(data, pathcodes))
+            if not rings:
+                continue
+            if filled:
+                parts = split_polygons(rings)
+            else:
+                # Closed lines end with a 'Z', which has no vertex
+                codes = np.asarray(pathcodes, dtype='<U1')
+                ends = np.append(np.flatnonzero(codes == 'M')[1:] - 1,
+                                 len(codes) - 1)
+                parts = [[np.concatenate([ring, ring[:1]]) if closed
+                          else ring]
+                         for ring, closed in zip(rings, codes[ends] == 'Z')]
+            properties = self._convert_style(style)
+            level = np.asarray(level, dtype=float)
+            properties['level'] = np.where(np.isfinite(level), level,
+                                           None).tolist()
+            self._add_parts(parts, filled, properties, multi=True,
+                            simplify=True)
+        return True
+
+    def draw_markers(self, data, coordinates, style, label, mplobj=None):
+        # The markers of a line all share one symbol, so draw them as a
+        # single MultiPoint feature.
+        vertices, pathcodes = style['markerpath']
+        pathstyle = dict((key, style[key]) for key in ['alpha', 'edgecolor',
+                                                       'facecolor', 'zorder',
+                                                       'edgewidth'])
+        pathstyle['dasharray'] = "10,0"
+        lonlat = self._transform(data)
+        symbol = self._symbol(vertices, pathcodes, pathstyle)
+        # Only clusters and WebGL points are drawn in the marker color
+        colors = (_marker_color(style, mplobj)
+                  if self.cluster or self.points == 'webgl' else None)
+        if self.points == 'webgl':
+            size = 2 * self._symbols[symbol]['radius']
+            self._add_point_layer(lonlat, colors, np.full(len(lonlat), size))
+        else:
+            self._add_markers(lonlat, np.full(len(lonlat), symbol), colors)
+
+    def draw_path_collection(self, paths, path_coordinates, path_transforms,
+                             offsets, offset_coordinates, offset_order,
+                             styles, mplobj=None):
+        """
+        Draw a marker collection (e.g. a scatter plot) as one MultiPoint
+        feature. Each distinct combination of path, transform and style is
+        added to the symbol table once; points reference their symbol by id
+        in the 'symbol' property. Other collections are drawn path by path.
+
+        """
+        if (path_coordinates not in ('figure', 'points', 'display')
+                or offset_order == 'before'
+                or len(paths) == 0 or len(offsets) == 0):
+            return super().draw_path_collection(
+                paths, path_coordinates, path_transforms, offsets,
+                offset_coordinates, offset_order, styles, mplobj)
+
+        N = max(len(paths), len(offsets))
+        # Cycle the offsets like Renderer._iter_path_collection does
+        lonlat = self._transform(np.resize(offsets, (N, 2)))
+
+        if len(path_transforms) == 0:
+            path_transforms = [np.eye(3)]
+        columns = [(list(range(len(paths))), None),
+                   (np.reshape(path_transforms, (-1, 9)), None),
+                   (styles['edgecolor'], 'none'),
+                   (styles['linewidth'], None),
+                   (styles['facecolor'], 'none')]
+        if self.points == 'webgl':
+            # Points are drawn as discs of their own color: only the path,
+            # transform and line width make their size.
+            columns = [columns[0], columns[1], columns[3]]
+
+        # Give every point an id per style column, where equal values share
+        # an id, then deduplicate the rows of ids into symbols.
+        values, ids = [], []
+        for column, empty in columns:
+            if np.size(column) == 0:
+                column = [empty]
+            if isinstance(column, list):
+                uniq, inverse = column, np.arange(len(column))
+            else:
+                column = np.asarray(column)
+                uniq, inverse = _unique_rows(column.reshape(len(column), -1))
+                uniq = uniq.reshape((-1,) + column.shape[1:])
+            values.append(uniq)
+            ids.append(inverse[np.arange(N) % len(inverse)])
+        keys, symbol = _unique_rows(np.column_stack(ids))
+
+        def transformed_path(ipath, itrans):
+            vertices, pathcodes = paths[values[0][ipath]]
+            path_transform = values[1][itrans].reshape(3, 3)
+            vertices = transforms.Affine2D(path_transform).transform(vertices)
+            return vertices, pathcodes
+
+        colors = styles['facecolor']
+        if np.size(colors) == 0:
+            colors = styles['edgecolor']
+        colors = np.reshape(colors, (-1, 4))
+        if len(colors):
+            colors = colors[np.arange(N) % len(colors)]
+        else:
+            colors = np.tile([0., 0., 0., 1.], (N, 1))
+
+        if self.points == 'webgl':
+            sizes = [2 * _marker_radius(transformed_path(ipath, itrans)[0],
+                                        values[2][ilw])
+                     for ipath, itrans, ilw in keys]
+            self._add_point_layer(lonlat, colors, np.asarray(sizes)[symbol])
+            return
+
+        symbols = []
+        for ipath, itrans, iec, ilw, ifc in keys:
+            vertices, pathcodes = transformed_path(ipath, itrans)
+            style = {"edgecolor": export_color(values[2][iec]),
+                     "facecolor": export_color(values[4][ifc]),
+                     "edgewidth": values[3][ilw],
+                     "dasharray": "10,0",
+                     "alpha": styles['alpha'],
+                     "zorder": styles['zorder']}
+            symbols.append(self._symbol(vertices, pathcodes, style))
+        self._add_markers(lonlat, np.asarray(symbols)[symbol], colors)
+
+    def _add_markers(self, lonlat, symbol, colors):
+        """
+        Add a MultiPoint feature of markers, with their symbol ids. When
+        clustering, colors (RGBA rows, or one row for all markers) are
+        averaged into the clusters computed for each zoom level.
+
+        """
+        members = {}
+        if self.cluster and len(lonlat) > 1:
+            colors = np.broadcast_to(colors, (len(lonlat), 4))
+            levels = cluster_points(web_mercator(lonlat), colors[:, :3],
+                                    self.cluster, _cluster_maxzoom)
+            # Colors are sent as 0xRRGGBB integers
+            clusters = [{
+                'coordinates': web_mercator_inverse(centroids),
+                'count': counts.astype(np.int64),
+                'color': np.round(rgb * 255).astype(np.int64) @ _rgb_weights,
+            } for centroids, counts, rgb in levels]
+            if clusters:
+                members['clusters'] = clusters
+        self._add_feature('MultiPoint', lonlat, {'symbol': symbol}, **members)
+
+    def _add_point_layer(self, lonlat, colors, sizes):
+        """
+        Add a point layer for 'webgl' points mode, as flat arrays of
+        positions, RGBA bytes and sizes (in pixels) of the points.
+
+        """
+        colors = np.broadcast_to(colors, (len(lonlat), 4))
+        self._point_layers.append({
+            'positions': lonlat.ravel(),
+            'colors': np.round(colors * 255).astype(np.uint8).ravel(),
+            'sizes': sizes,
+        })
+
+    def draw_image(self, imdata, extent, coordinates, style, mplobj=None):
+        """
+        Keep an image as a raster, drawn in the coordinates of the figure.
+        Images are warped when the GeoJSON is made.
+
+        """
+        if coordinates != 'data' or mplobj is None:
+            return
+        self.rasters.append(rasters.raster(
+            imdata, extent, mplobj.origin, mplobj.cmap, mplobj.norm,
+            style['alpha'], self.crs_key))
+
+    def draw_quadmesh(self, vertices, values, coordinates, style,
+                      mplobj=None):
+        """
+        Draw a mesh of more than _mesh_polygons cells as a raster (see
+        rasters.mesh), colormapped like the QuadMesh. Smaller meshes are
+        left to draw_path_collection, as one polygon per cell.
+
+        """
+        cells = (len(vertices) - 1) * (len(vertices[0]) - 1)
+        if coordinates != 'data' or cells <= _mesh_polygons:
+            return False
+        raster = rasters.mesh(vertices, values, getattr(mplobj, 'cmap', None),
+                              getattr(mplobj, 'norm', None), style['alpha'],
+                              self.crs_key)
+        if raster is not None:
+            self.rasters.append(raster)
+        return True
+
     def draw_text(self, *args, **kwargs):
         """ Don't draw the text for now, but don't crash """
         pass
@@ -144,4 +493,95 @@ class LeafletRenderer(renderer.Renderer):
 def _crs_from_epsg(epsg):
     epsgstr = 'epsg:{}'.format(epsg)
     crs = {'init': epsgstr, 'no_defs': True}
-    return crs
\ No newline at end of file
+    return crs
+
+
+def _marker_color(style, mplobj):
+    """
+    RGBA row of the markers of a line: their face color, or their edge
+    color if they are not filled. Colors are read from the Line2D, the
+    style only has their CSS.
+    """
+    if mplobj is not None:
+        color = mplobj.get_markerfacecolor()
+        if to_rgba(color)[3] == 0:
+            color = mplobj.get_markeredgecolor()
+        return [to_rgba(color, mplobj.get_alpha())]
+    color = style['facecolor']
+    if color == 'none':
+        color = style['edgecolor']
+    match = re.fullmatch(r'rgba\((\d+), (\d+), (\d+), ([^)]+)\)', color)
+    if match:
+        r, g, b, a = map(float, match.groups())
+        return [(r / 255, g / 255, b / 255, a * style['alpha'])]
+    return [to_rgba(color, style['alpha'])]
+
+
+def _ring_lengths(parts):
+    return [len(ring) for part in parts for ring in part]
+
+
+def _marker_radius(vertices, edgewidth):
+    """Radius of a marker path drawn with the given line width"""
+    return np.abs(vertices).max() + edgewidth / 2
+
+
+def _unique_rows(a):
+    """
+    Return the unique rows of a 2D array and the inverse indices.
+
+    Equivalent to np.unique(a, axis=0, return_inverse=True) without the
+    sort on row views, which is slow for long arrays: columns are folded
+    into dense int64 ids one at a time instead. Unique rows are returned in
+    the order of their first occurrence.
+    """
+    inverse = np.zeros(len(a), dtype=np.int64)
+    for col in a.T:
+        _, col_ids = np.unique(col, return_inverse=True)
+        _, inverse = np.unique(inverse * (col_ids.max() + 1) + col_ids,
+                               return_inverse=True)
+    inverse = inverse.ravel()
+    first = np.full(inverse.max() + 1 if len(a) else 0, len(a))
+    np.minimum.at(first, inverse, np.arange(len(a)))
+    # Renumber so that ids follow the order of first occurrence
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return a[first[order]], rank[inverse]
+
+
+def _crs_key(crs):
+    """Normalize a pyproj crs dict into a hashable key"""
+    items = []
+    for k, v in crs.items():
+        if k == 'init' and isinstance(v, str):
+            v = v.lower()
+        elif isinstance(v, list):
+            v = tuple(v)
+        items.append((k, v))
+    return tuple(sorted(items))
+
+
+@lru_cache(maxsize=_transformer_cache_size)
+def _cached_transformer(crs_key):
+    # pyproj Transformers keep per-thread state, so one instance can be
+    # shared by every renderer in the process.
+    import pyproj
+    proj_in = pyproj.Proj(preserve_units=True, **dict(crs_key))
+    proj_out = pyproj.Proj(preserve_units=True, **_crs_from_epsg(4326))
+    return pyproj.Transformer.from_crs(proj_in.crs, proj_out.crs,
+                                       always_xy=True)
+
+
+def transformer_cache_info():
+    """
+    Return the hits, misses, maxsize and currsize of the process-wide cache
+    of CRS transformers used by LeafletRenderer.
+
+    """
+    return _cached_transformer.cache_info()
+
+
+def clear_transformer_cache():
+    """Empty the process-wide cache of CRS transformers"""
+    _cached_transformer.cache_clear()
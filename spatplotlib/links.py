@@ -1,4 +1,115 @@
-import urllib
+import hashlib
+import os
+import tempfile
+import threading
+import urllib.request
+
+# Seconds to wait for the server of a link before giving up
+timeout = 10
+
+# Text of the links read in this process, by url
+_assets = {}
+_assets_lock = threading.Lock()
+
+
+def cache_directory():
+    """Directory of the asset cache: $SPATPLOTLIB_ASSETS, or
+    ~/.cache/spatplotlib/assets"""
+    return os.environ.get('SPATPLOTLIB_ASSETS', os.path.join(
+        os.path.expanduser('~'), '.cache', 'spatplotlib', 'assets'))
+
+
+def cache_asset(url, filename):
+    """Add a file to the asset cache as the content of url.
+
+    The cache stores each asset once, under the SHA-256 of its content,
+    with a reference from the hash of its url. Seeding it this way (or
+    copying a cache directory) lets computers without network access
+    embed links.
+
+    Parameters
+    ----------
+        url : str
+            The url of the asset
+        filename : str
+            Path of a local copy of the asset
+    """
+    with open(filename, 'rb') as f:
+        data = f.read()
+    _store(url, data)
+    with _assets_lock:
+        _assets[url] = data.decode('utf8')
+
+
+def _url_key(url):
+    return hashlib.sha256(url.encode('utf8')).hexdigest()
+
+
+def _write_atomic(path, data):
+    directory = os.path.dirname(path)
+    fd, tmp = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _store(url, data):
+    directory = cache_directory()
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256(data).hexdigest()
+    path = os.path.join(directory, digest)
+    if not os.path.exists(path):
+        _write_atomic(path, data)
+    _write_atomic(os.path.join(directory, _url_key(url) + '.ref'),
+                  digest.encode('ascii'))
+
+
+def _load(url):
+    """Content of url in the asset cache, or None"""
+    directory = cache_directory()
+    try:
+        with open(os.path.join(directory, _url_key(url) + '.ref')) as f:
+            digest = f.read().strip()
+        with open(os.path.join(directory, digest), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    # A file that does not match its hash is damaged, download it again
+    if hashlib.sha256(data).hexdigest() != digest:
+        return None
+    return data
+
+
+def fetch(url):
+    """Text of url, from this process, the asset cache or the network.
+
+    Downloads are added to the asset cache, so that each asset is
+    downloaded once per computer. They are made without holding the lock,
+    so that a slow server does not hold up the other threads.
+    """
+    with _assets_lock:
+        if url in _assets:
+            return _assets[url]
+        data = _load(url)
+        if data is not None:
+            _assets[url] = data.decode('utf8')
+            return _assets[url]
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            data = response.read()
+    except OSError as e:
+        raise OSError("Could not download {} to embed it ({}). "
+                      "Add it to the asset cache with "
+                      "links.cache_asset().".format(url, e)) from e
+    with _assets_lock:
+        # Another thread may have downloaded it meanwhile
+        if url not in _assets:
+            try:
+                _store(url, data)
+            except OSError:
+                pass
+            _assets[url] = data.decode('utf8')
+        return _assets[url]
 
 
 class Link(object):
@@ -12,9 +123,13 @@ class Link(object):
                 Whether the target document shall be loaded right now.
         """
         self.url = url
-        self.code = None
         if download:
-            self.code = urllib.request.urlopen(self.url).read()
+            fetch(self.url)
+
+    @property
+    def code(self):
+        """Text of the target document, downloaded once (see fetch)"""
+        return fetch(self.url)
 
 
 class JavascriptLink(Link):
@@ -27,8 +142,6 @@ class JavascriptLink(Link):
                 Whether the code shall be embedded explicitely in the render.
         """
         if embedded:
-            if self.code is None:
-                self.code = urllib.request.urlopen(self.url).read()
             return '<script>{}</script>'.format(self.code)
         else:
             return '<script src="{}"></script>'.format(self.url)
@@ -44,10 +157,6 @@ class CssLink(Link):
                 Whether the code shall be embedded explicitely in the render.
         """
         if embedded:
-            if self.code is None:
-                self.code = urllib.request.urlopen(self.url).read()
             return '<style>{}</style>'.format(self.code)
         else:
             return '<link rel="stylesheet" href="{}" />'.format(self.url)
-
-
@@ -0,0 +1,549 @@
+"""
+Rasters
+=======
+Draw images and meshes on the map, as one image overlay embedded in the
+page, or as a z/x/y pyramid of PNG tiles for rasters too large for one.
+
+Leaflet stretches images linearly in Web Mercator, so rasters are warped:
+every output pixel is projected back to the coordinates of the raster and
+takes the value of the raster pixel it falls in (nearest neighbour). Values
+are colormapped after sampling, so only the pixels drawn are read and
+colored. Each tile is sampled from the raster on its own, in parallel, and
+workers read memory-mapped rasters (np.load(..., mmap_mode='r')) through
+their own mapping, so rasters do not need to fit in memory.
+"""
+import base64
+import copy
+import io
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import matplotlib
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.cm import ScalarMappable
+from matplotlib.collections import QuadMesh
+from matplotlib.colors import Normalize
+from matplotlib.figure import Figure
+from PIL import Image
+
+from . import leaflet_renderer
+from .utils import web_mercator, web_mercator_inverse
+
+_tile_size = 256
+_max_zoom = 22
+# Longest side in pixels of the image overlays embedded in pages
+_max_overlay_size = 2048
+# Longest side in pixels of the grid curvilinear meshes are drawn on
+_max_mesh_size = 4096
+# Number of tiles rendered by a worker in one task
+_chunk_tiles = 64
+# Points per side of the grid projected to find the bounds of a raster
+_grid_points = 64
+# Rows read at once when scanning a raster for the range of its values
+_block_rows = 1024
+
+# Raster of the tiles rendered by this process (see _init_worker)
+_worker_raster = None
+
+
+def raster(data, extent, origin='upper', cmap=None, norm=None, alpha=None,
+           crs_key=None):
+    """
+    Describe a raster for image_overlay() and the tile pyramids
+
+    Parameters
+    ----------
+    data : array
+        (M, N) values, or (M, N, 3) or (M, N, 4) RGB(A) image, like imshow
+    extent : sequence
+        [left, right, bottom, top] edges of the raster in data coordinates
+    origin : string, default 'upper'
+        Whether row 0 is at the top or bottom of the extent, like imshow
+    cmap, norm :
+        Colormap and normalization of the values. The norm is scaled to
+        the range of the values if it is not already.
+    alpha : float or array, default None
+        Opacity of the raster, or of each of its values like imshow. An
+        array of opacities is applied to the colors of the values at once.
+    crs_key : tuple, default None
+        Normalized pyproj crs of the data coordinates (see
+        leaflet_renderer._crs_key), or None for lon/lat
+
+    Returns
+    -------
+    Dictionary of the raster
+    """
+    if origin not in ('upper', 'lower'):
+        raise ValueError("origin must be one of ('upper', 'lower'), not {!r}"
+                         .format(origin))
+    if np.ndim(data) not in (2, 3):
+        raise ValueError('data must be a 2D array or an RGB(A) image')
+    rows, columns = np.shape(data)[:2]
+    left, right, bottom, top = (float(v) for v in extent)
+    if origin == 'upper':
+        bottom, top = top, bottom
+    return rectilinear(data, np.linspace(left, right, columns + 1),
+                       np.linspace(bottom, top, rows + 1), cmap, norm, alpha,
+                       crs_key)
+
+
+def rectilinear(data, x, y, cmap=None, norm=None, alpha=None, crs_key=None):
+    """
+    Describe a raster of cells between edges, like pcolormesh(x, y, data)
+
+    Parameters
+    ----------
+    data : array
+        (M, N) values, or (M, N, 3) or (M, N, 4) RGB(A) image
+    x, y : array
+        The N + 1 column edges and the M + 1 row edges, in data
+        coordinates, increasing or decreasing
+    cmap, norm, alpha, crs_key :
+        See raster()
+
+    Returns
+    -------
+    Dictionary of the raster
+    """
+    cmap = matplotlib.colormaps.get_cmap(cmap)
+    if np.ndim(alpha):
+        data = _with_alpha(data, cmap, _scaled(norm, data), alpha)
+        alpha = None
+    return {
+        'data': data,
+        'x': np.asarray(x, dtype=float),
+        'y': np.asarray(y, dtype=float),
+        'cmap': cmap,
+        'norm': _scaled(norm, data),
+        'alpha': alpha,
+        'crs': crs_key,
+    }
+
+
+def mesh(vertices, values, cmap=None, norm=None, alpha=None, crs_key=None):
+    """
+    Describe a raster of the cells of a quadrilateral mesh, like pcolormesh
+
+    Meshes of cells between column and row edges are sampled like images.
+    Curvilinear meshes, and meshes of values at their vertices (shading
+    'gouraud'), are drawn (with Agg) on a grid of Web Mercator pixels of
+    about their own resolution first.
+
+    Parameters
+    ----------
+    vertices : array
+        (M + 1, N + 1, 2) corners of the cells, in data coordinates (see
+        QuadMesh.get_coordinates())
+    values : array
+        (M, N) values, or (M, N, 3) or (M, N, 4) RGB(A) colors of the
+        cells, or (M + 1, N + 1) ones of the vertices, interpolated across
+        the cells
+    cmap, norm, alpha, crs_key :
+        See raster()
+
+    Returns
+    -------
+    Dictionary of the raster, or None if the mesh covers nothing
+    """
+    vertices = np.asarray(vertices, dtype=float)
+    gouraud = np.shape(values)[:2] == vertices.shape[:2]
+    masked = np.ma.getmaskarray(values)
+    cmap = matplotlib.colormaps.get_cmap(cmap)
+    if np.ndim(alpha):
+        values = _with_alpha(values, cmap, _scaled(norm, values), alpha)
+        alpha = None
+    x, y = vertices[0, :, 0], vertices[:, 0, 1]
+    if (not gouraud and (vertices[..., 0] == x).all()
+            and (vertices[..., 1] == y[:, None]).all()
+            and _monotonic(x) and _monotonic(y)):
+        return rectilinear(values, x, y, cmap, norm, alpha, crs_key)
+
+    colors = _colorize(values, cmap, _scaled(norm, values)).reshape(-1, 4)
+    colors = colors / 255
+    lon, lat = _to_lonlat({'crs': crs_key}, vertices[..., 0].ravel(),
+                          vertices[..., 1].ravel())
+    world = web_mercator(np.column_stack([lon, lat]))
+    world = world.reshape(vertices.shape)
+    finite = np.isfinite(world).all(axis=-1)
+    if not finite.any():
+        return None
+    box = (*world[finite].min(axis=0), *world[finite].max(axis=0))
+    if box[2] <= box[0] or box[3] <= box[1]:
+        return None
+    # Cells with a corner that cannot be projected are not drawn
+    world[~finite] = box[:2]
+    if gouraud:
+        # Matplotlib drops the triangles of masked vertices, and those
+        # with a NaN alpha
+        hidden = ~finite | masked.reshape(*finite.shape, -1).any(axis=-1)
+        colors[hidden.ravel(), 3] = np.nan
+    else:
+        hidden = ~(finite[:-1, :-1] & finite[1:, :-1] & finite[:-1, 1:]
+                   & finite[1:, 1:])
+        colors[hidden.ravel(), 3] = 0
+
+    size = min(max(np.shape(values)[:2]), _max_mesh_size)
+    rgba = _draw_mesh(world, colors, box, _shape(size, box),
+                      'gouraud' if gouraud else 'flat')
+    height, width = rgba.shape[:2]
+    # Columns are evenly spaced in longitude, rows in world coordinates
+    lon = np.linspace(box[0], box[2], width + 1) * 360 - 180
+    wy = np.linspace(box[1], box[3], height + 1)
+    lat = web_mercator_inverse(np.column_stack([wy, wy]))[:, 1]
+    return rectilinear(rgba, lon, lat, alpha=alpha)
+
+
+def image_overlay(r):
+    """
+    Warp a raster into a PNG image for L.imageOverlay
+
+    The image has the resolution of the raster, up to _max_overlay_size
+    pixels along its longest side.
+
+    Returns
+    -------
+    Dictionary of the image as a data url, its bounds [[south, west],
+    [north, east]] and opacity, or None if the raster covers nothing
+    """
+    box = _world_box(r)
+    if box is None:
+        return None
+    size = min(max(np.shape(r['data'])[:2]), _max_overlay_size)
+    rgba = _sample(r, box, _shape(size, box))
+    (west, north), (east, south) = web_mercator_inverse(
+        np.array([box[:2], box[2:]])).tolist()
+    return {
+        "url": 'data:image/png;base64,'
+               + base64.b64encode(_png(rgba)).decode('ascii'),
+        "bounds": [[south, west], [north, east]],
+        "opacity": 1 if r['alpha'] is None else r['alpha'],
+    }
+
+
+def raster_to_tiles(data, extent, outdir='_raster', origin='upper', cmap=None,
+                    norm=None, vmin=None, vmax=None, crs=None, epsg=None,
+                    minzoom=0, maxzoom=None, processes=None):
+    """
+    Convert an array to a directory of PNG map tiles
+
+    The tiles are written to outdir/{z}/{x}/{y}.png, for L.tileLayer or
+    any other web map; tiles with no pixel of the raster are not written.
+    The array is only read tile by tile, so it may be a np.memmap larger
+    than memory, or the name of a .npy file, which is memory-mapped.
+
+    Parameters
+    ----------
+    data : array or string
+        (M, N) values, or (M, N, 3) or (M, N, 4) RGB(A) image, like imshow,
+        or the name of a .npy file of one
+    extent : sequence
+        [left, right, bottom, top] edges of the raster in data coordinates
+    outdir : string, default '_raster'
+        The directory to write the tiles to
+    origin : string, default 'upper'
+        Whether row 0 is at the top or bottom of the extent, like imshow
+    cmap : string or Colormap, default rcParams['image.cmap']
+        Colormap of the values
+    norm : Normalize, default None
+        Normalization of the values; Normalize(vmin, vmax) if not given
+    vmin, vmax : float, default None
+        Range of the colormap. Missing bounds are the range of the values,
+        found by reading the array once.
+    crs : dict, default assumes lon/lat
+        pyproj definition of the data coordinates. See fig_to_html().
+    epsg : int, default 4326
+        The EPSG code of the data coordinates. See fig_to_html().
+    minzoom : int, default 0
+        Coarsest zoom level of the tiles
+    maxzoom : int, default None
+        Finest zoom level of the tiles, by default the one where tile
+        pixels are about the size of raster pixels
+    processes : int, default None
+        Number of worker processes; None uses every core, and 1 generates
+        the tiles in the current process.
+
+    Returns
+    -------
+    Dictionary with the url template of the tiles relative to outdir,
+    their minzoom and maxzoom, and their bounds [west, south, east, north]
+    and opacity
+    """
+    if crs is not None and epsg is not None:
+        raise ValueError('crs and epsg cannot both be specified')
+    if epsg is not None:
+        crs = leaflet_renderer._crs_from_epsg(epsg)
+    if isinstance(data, (str, os.PathLike)):
+        data = np.load(data, mmap_mode='r')
+    if norm is None:
+        norm = Normalize(vmin, vmax)
+    r = raster(data, extent, origin, cmap, norm,
+               crs_key=(leaflet_renderer._crs_key(crs) if crs is not None
+                        else None))
+    meta = write_pyramid(r, outdir, minzoom, maxzoom, processes)
+    if meta is None:
+        raise ValueError('the raster covers no part of the map')
+    return dict(meta, url='{z}/{x}/{y}.png')
+
+
+def write_pyramid(r, outdir, minzoom=0, maxzoom=None, processes=None):
+    """
+    Write the PNG tiles of a raster to outdir/{z}/{x}/{y}.png
+
+    maxzoom is capped at the zoom level where tile pixels are about the
+    size of raster pixels; finer tiles would add no detail.
+
+    Returns
+    -------
+    Dictionary with the minzoom, maxzoom, bounds [west, south, east,
+    north] and opacity of the tiles, or None if the raster covers nothing
+    """
+    box = _world_box(r)
+    if box is None:
+        return None
+    native = _native_zoom(r, box)
+    maxzoom = native if maxzoom is None else min(maxzoom, native)
+    minzoom = min(minzoom, maxzoom)
+    tasks = [(z, tiles, outdir) for z, tiles in _tasks(box, minzoom, maxzoom)]
+    if processes == 1:
+        _init_worker(r)
+        for task in tasks:
+            _render_tiles(task)
+    else:
+        with ProcessPoolExecutor(max_workers=processes,
+                                 initializer=_init_worker,
+                                 initargs=(_portable(r),)) as executor:
+            for _ in executor.map(_render_tiles, tasks):
+                pass
+    (west, north), (east, south) = web_mercator_inverse(
+        np.array([box[:2], box[2:]])).tolist()
+    return {'minzoom': minzoom, 'maxzoom': maxzoom,
+            'bounds': [west, south, east, north],
+            'opacity': 1 if r['alpha'] is None else r['alpha']}
+
+
+def _scaled(norm, data):
+    """The norm of values, scaled to their range if it is not already"""
+    if norm is None:
+        norm = Normalize()
+    if np.ndim(data) == 2 and not norm.scaled():
+        norm = copy.copy(norm)
+        norm.vmin, norm.vmax = (v if v is not None else r for v, r in
+                                zip((norm.vmin, norm.vmax),
+                                    _value_range(data)))
+    return norm
+
+
+def _monotonic(edges):
+    steps = np.diff(edges)
+    return len(edges) > 1 and ((steps > 0).all() or (steps < 0).all())
+
+
+def _shape(size, box):
+    """(height, width) of a grid covering box, with size pixels along its
+    longest side"""
+    width, height = box[2] - box[0], box[3] - box[1]
+    if width >= height:
+        return max(1, round(size * height / width)), size
+    return size, max(1, round(size * width / height))
+
+
+def _draw_mesh(world, colors, box, shape, shading='flat'):
+    """
+    Draw the cells of a mesh in world coordinates, of RGBA colors (of the
+    cells, or of the vertices with shading 'gouraud'), on a grid of pixels
+    covering box, of shape (height, width). Returns the RGBA bytes of the
+    grid.
+    """
+    height, width = shape
+    fig = Figure(figsize=(width, height), dpi=1)
+    fig.patch.set_visible(False)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.set_axis_off()
+    ax.patch.set_visible(False)
+    ax.set_xlim(box[0], box[2])
+    # Rows of world coordinates run southwards
+    ax.set_ylim(box[3], box[1])
+    ax.add_collection(QuadMesh(world, facecolors=colors, shading=shading,
+                               edgecolors='none', linewidths=0,
+                               antialiased=False))
+    canvas = FigureCanvasAgg(fig)
+    canvas.draw()
+    return np.array(canvas.buffer_rgba())
+
+
+def _value_range(data):
+    """Finite (min, max) of an array, read a block of rows at a time"""
+    lo, hi = np.inf, -np.inf
+    for start in range(0, len(data), _block_rows):
+        block = np.ma.masked_invalid(data[start:start + _block_rows])
+        if block.count():
+            lo, hi = min(lo, block.min()), max(hi, block.max())
+    return (float(lo), float(hi)) if lo <= hi else (0., 1.)
+
+
+def _to_lonlat(r, x, y):
+    if r['crs'] is None:
+        return x, y
+    return leaflet_renderer._cached_transformer(r['crs']).transform(x, y)
+
+
+def _to_data(r, lon, lat):
+    if r['crs'] is None:
+        return lon, lat
+    transformer = leaflet_renderer._cached_transformer(r['crs'])
+    return transformer.transform(lon, lat, direction='INVERSE')
+
+
+def _world_box(r):
+    """
+    Bounds (x0, y0, x1, y1) of a raster in world coordinates, found from
+    a grid of points over it, or None if it is empty
+    """
+    x, y = np.meshgrid(np.linspace(r['x'][0], r['x'][-1], _grid_points),
+                       np.linspace(r['y'][0], r['y'][-1], _grid_points))
+    lon, lat = _to_lonlat(r, x.ravel(), y.ravel())
+    world = web_mercator(np.column_stack([lon, lat]))
+    world = world[np.isfinite(world).all(axis=1)]
+    if not len(world):
+        return None
+    box = (*world.min(axis=0), *world.max(axis=0))
+    if box[2] <= box[0] or box[3] <= box[1]:
+        return None
+    return box
+
+
+def _native_zoom(r, box):
+    """Zoom level at which tile pixels are about the size of raster pixels"""
+    rows, columns = np.shape(r['data'])[:2]
+    pixel = min((box[2] - box[0]) / columns, (box[3] - box[1]) / rows)
+    return int(np.clip(np.ceil(np.log2(1 / (_tile_size * pixel))),
+                       0, _max_zoom))
+
+
+def _index(v, edges):
+    """Index of the cells between edges containing v, or -1"""
+    n = len(edges) - 1
+    descending = edges[-1] < edges[0]
+    if descending:
+        edges = edges[::-1]
+    # NaN is sorted after the last edge
+    i = np.searchsorted(edges, v, side='right') - 1
+    i[(i < 0) | (i >= n)] = -1
+    if descending:
+        i[i >= 0] = n - 1 - i[i >= 0]
+    return i
+
+
+def _sample(r, box, shape):
+    """
+    Warp a raster onto a grid of pixels covering box (x0, y0, x1, y1) in
+    world coordinates, of shape (height, width). Returns RGBA bytes, with
+    the pixels outside of the raster transparent.
+    """
+    height, width = shape
+    wx = box[0] + (np.arange(width) + 0.5) * (box[2] - box[0]) / width
+    wy = box[1] + (np.arange(height) + 0.5) * (box[3] - box[1]) / height
+    data = r['data']
+    if r['crs'] is None:
+        # Longitude only depends on the column and latitude on the row, so
+        # whole rows and columns of the raster are picked at once.
+        lon = web_mercator_inverse(np.column_stack([wx, wx]))[:, 0]
+        lat = web_mercator_inverse(np.column_stack([wy, wy]))[:, 1]
+        i = _index(lat, r['y'])
+        j = _index(lon, r['x'])
+        valid = (i >= 0)[:, None] & (j >= 0)[None, :]
+        values = data[np.ix_(np.maximum(i, 0), np.maximum(j, 0))]
+    else:
+        world = np.column_stack([np.tile(wx, height), np.repeat(wy, width)])
+        lonlat = web_mercator_inverse(world)
+        x, y = _to_data(r, lonlat[:, 0], lonlat[:, 1])
+        i = _index(np.reshape(y, shape), r['y'])
+        j = _index(np.reshape(x, shape), r['x'])
+        valid = (i >= 0) & (j >= 0)
+        values = data[np.maximum(i, 0), np.maximum(j, 0)]
+    rgba = _colorize(values, r['cmap'], r['norm'])
+    rgba[~valid, 3] = 0
+    return rgba
+
+
+def _colorize(values, cmap, norm):
+    """RGBA bytes of sampled values, or of an RGB(A) image as it is"""
+    if np.ndim(values) == 3:
+        return np.array(ScalarMappable().to_rgba(np.asarray(values),
+                                                  bytes=True))
+    return cmap(norm(values), bytes=True)
+
+
+def _with_alpha(data, cmap, norm, alpha):
+    """
+    RGBA bytes of values or of an RGB(A) image, with an array of
+    opacities. Like matplotlib, the opacity replaces that of the colors of
+    values, except for bad values, and scales that of an image.
+    """
+    rgba = _colorize(data, cmap, norm)
+    alpha = np.clip(np.broadcast_to(alpha, rgba.shape[:2]), 0, 1)
+    if np.ndim(data) == 3:
+        rgba[..., 3] = np.round(rgba[..., 3] * alpha)
+    else:
+        good = ~np.ma.getmaskarray(np.ma.masked_invalid(data))
+        rgba[..., 3][good] = np.round(alpha[good] * 255)
+    return rgba
+
+
+def _png(rgba):
+    buffer = io.BytesIO()
+    Image.fromarray(rgba).save(buffer, format='png')
+    return buffer.getvalue()
+
+
+def _tasks(box, minzoom, maxzoom):
+    """Yield the zoom level and chunks of (x, y) of the tiles of a box"""
+    for z in range(minzoom, maxzoom + 1):
+        n = 2 ** z
+        x0, y0 = np.clip(np.floor(np.array(box[:2]) * n), 0, n - 1)
+        x1, y1 = np.clip(np.floor(np.array(box[2:]) * n), 0, n - 1)
+        tiles = [(x, y) for x in range(int(x0), int(x1) + 1)
+                 for y in range(int(y0), int(y1) + 1)]
+        for start in range(0, len(tiles), _chunk_tiles):
+            yield z, tiles[start:start + _chunk_tiles]
+
+
+def _portable(r):
+    """
+    A raster to send to worker processes: memory-mapped arrays are sent as
+    the description of their mapping instead of their content
+    """
+    data = r['data']
+    if (isinstance(data, np.memmap) and isinstance(data.base, mmap.mmap)
+            and data.filename):
+        order = 'F' if data.flags.f_contiguous and data.ndim > 1 else 'C'
+        data = ('memmap', data.filename, data.dtype.str, data.shape,
+                data.offset, order)
+    return dict(r, data=data)
+
+
+def _init_worker(r):
+    global _worker_raster
+    if isinstance(r['data'], tuple):
+        _, filename, dtype, shape, offset, order = r['data']
+        r = dict(r, data=np.memmap(filename, dtype=dtype, mode='r',
+                                   shape=shape, offset=offset, order=order))
+    _worker_raster = r
+
+
+def _render_tiles(task):
+    """Render and write a chunk of the tiles of _worker_raster"""
+    z, tiles, outdir = task
+    n = 2 ** z
+    for x, y in tiles:
+        rgba = _sample(_worker_raster, (x / n, y / n, (x + 1) / n,
+                                        (y + 1) / n),
+                       (_tile_size, _tile_size))
+        if not rgba[..., 3].any():
+            continue
+        path = os.path.join(outdir, str(z), str(x), '{}.png'.format(y))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(_png(rgba))
@@ -11,6 +11,9 @@ from . import utils
 
 
 class Renderer(object):
+    # Whether draw_image receives the array of images rather than a png
+    image_arrays = False
+
     @staticmethod
     def ax_zoomable(ax):
         return bool(ax and ax.get_navigate())
@@ -195,6 +198,10 @@ class Renderer(object):
         if Version(mpl.__version__) < Version('1.4.0'):
             if path_transforms is None:
                 path_transforms = [np.eye(3)]
+        # Collections without per-path transforms (contours, patch
+        # collections) give an empty array, which would stop the cycle.
+        if path_transforms is not None and np.size(path_transforms) == 0:
+            path_transforms = [np.eye(3)]
 
         edgecolor = styles['edgecolor']
         if np.size(edgecolor) == 0:
@@ -366,14 +373,78 @@ class Renderer(object):
         """
         raise NotImplementedError()
 
+    def draw_contour(self, paths, levels, filled, coordinates, styles,
+                     mplobj=None):
+        """
+        Draw a contour set, e.g. of contour or contourf.
+
+        By default contour sets are not drawn as such, and the exporter
+        draws them with draw_path_collection.
+
+        Parameters
+        ----------
+        paths : list
+            list of tuples (data, pathcodes), one path per level, holding
+            all the lines or polygons of the level. See draw_path().
+        levels : array
+            (N,) levels of the lines, or (N, 2) lower and upper levels of
+            the filled bands, -inf or inf for the bands of extend
+        filled : bool
+            Whether the paths are filled bands (contourf)
+        coordinates: string
+            A string code, which should be either 'data' for data coordinates,
+            or 'figure' for figure (pixel) coordinates.
+        styles : list
+            the style dictionaries of the paths. See draw_path().
+        mplobj : matplotlib object
+            the matplotlib ContourSet which generated these paths
+
+        Returns
+        -------
+        Whether the contour set was drawn
+        """
+        return False
+
+    def draw_quadmesh(self, vertices, values, coordinates, style,
+                      mplobj=None):
+        """
+        Draw a quadrilateral mesh, e.g. of pcolormesh.
+
+        By default meshes are not drawn as such, and the exporter draws
+        them with draw_path_collection.
+
+        Parameters
+        ----------
+        vertices : array
+            (M + 1, N + 1, 2) corners of the cells
+        values : masked array
+            (M, N) values of the cells, colormapped by mplobj, or
+            (M, N, 3) or (M, N, 4) RGB(A) colors of the cells. With
+            shading 'gouraud', (M + 1, N + 1) values or colors of the
+            vertices.
+        coordinates: string
+            A string code, which should be either 'data' for data coordinates,
+            or 'figure' for figure (pixel) coordinates.
+        style : dictionary
+            a dictionary specifying the appearance of the mesh
+        mplobj : matplotlib object
+            the matplotlib QuadMesh which generated this mesh
+
+        Returns
+        -------
+        Whether the mesh was drawn
+        """
+        return False
+
     def draw_image(self, imdata, extent, coordinates, style, mplobj=None):
         """
         Draw an image.
 
         Parameters
         ----------
-        imdata : string
-            base64 encoded png representation of the image
+        imdata : string or array
+            base64 encoded png representation of the image, or the array
+            of the image (AxesImage.get_array()) if image_arrays is True
         extent : list
             the axes extent of the image: [xmin, xmax, ymin, ymax]
         coordinates: string
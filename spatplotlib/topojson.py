@@ -0,0 +1,296 @@
+"""
+TopoJSON
+========
+Convert the GeoJSON of LeafletRenderer to a TopoJSON topology, where the
+boundaries shared by lines and polygons are stored once as arcs.
+
+Arcs are built like the reference TopoJSON implementation: vertices where
+lines meet, split or end are junctions, rings and lines are cut into arcs
+at junctions, and equal arcs (in either direction) are stored once. All
+steps are vectorized over the vertices of all rings at once.
+"""
+import numpy as np
+
+from .leaflet_renderer import _unique_rows
+
+# Multiplier of the polynomial hash identifying arcs by their vertices
+_hash_base = np.uint64(0x9E3779B97F4A7C15)
+
+
+def topology(gj, precision=None, quantize=False):
+    """
+    Convert a GeoJSON dictionary to a TopoJSON topology
+
+    Polygons and lines, single or multi, become geometries referencing
+    their arcs; points keep their coordinates. The features are in the
+    "figure" object, a GeometryCollection, and the symbol table, point
+    layers and images of the GeoJSON are kept as they are. Levels of detail
+    and clusters are not.
+
+    Parameters
+    ----------
+    gj : dict
+        GeoJSON dictionary, as returned by LeafletRenderer.geojson()
+    precision : int, default None
+        If given, positions are rounded to this many decimals, as they are
+        when written, before shared boundaries are found. Boundaries
+        computed separately for each polygon, like the bands of contourf,
+        usually differ in their last digits.
+    quantize : bool, default False
+        If True, positions are written as integers on the grid of
+        precision, with a TopoJSON transform, and arcs are delta encoded.
+
+    Returns
+    -------
+    TopoJSON dictionary
+    """
+    if quantize and precision is None:
+        raise ValueError("quantize needs a precision")
+
+    # Every ring and line is a sequence of vertices; rings are cyclic
+    sequences, closed, owners = [], [], []
+    for i, feature in enumerate(gj['features']):
+        geometry = feature['geometry']
+        parts = _parts(geometry)
+        for j, part in enumerate(parts or []):
+            rings = part if geometry['type'].endswith('Polygon') else [part]
+            for ring in rings:
+                sequences.append(ring)
+                closed.append(geometry['type'].endswith('Polygon'))
+                owners.append((i, j))
+
+    arcs, refs = _build_arcs(sequences, np.array(closed, dtype=bool),
+                             precision)
+
+    rings = {}
+    for owner, sequence_refs in zip(owners, refs):
+        if sequence_refs is not None:
+            rings.setdefault(owner, []).append(sequence_refs)
+    geometries = []
+    for i, feature in enumerate(gj['features']):
+        geometry = feature['geometry']
+        parts = _parts(geometry)
+        if parts is None:
+            geometries.append({"type": geometry['type'],
+                               "coordinates": geometry['coordinates'],
+                               "properties": feature['properties']})
+            continue
+        parts = [rings[i, j] for j in range(len(parts)) if (i, j) in rings]
+        if not parts:
+            continue
+        if geometry['type'].endswith('LineString'):
+            parts = [part[0] for part in parts]
+        if not geometry['type'].startswith('Multi'):
+            parts = parts[0]
+        geometries.append({
+            "type": geometry['type'],
+            "arcs": parts,
+            "properties": feature['properties'],
+        })
+
+    topo = {
+        "type": "Topology",
+        "objects": {
+            "figure": {"type": "GeometryCollection",
+                       "geometries": geometries},
+        },
+        "arcs": arcs,
+        "symbols": gj['symbols'],
+    }
+    for member in ("points", "images"):
+        if member in gj:
+            topo[member] = gj[member]
+    if quantize:
+        _quantize(topo, precision)
+    return topo
+
+
+def _parts(geometry):
+    """The polygons (lists of rings) or lines of a geometry made of arcs, or
+    None for points"""
+    coordinates = geometry['coordinates']
+    return {'Polygon': [coordinates], 'MultiPolygon': coordinates,
+            'LineString': [coordinates],
+            'MultiLineString': coordinates}.get(geometry['type'])
+
+
+def _build_arcs(sequences, closed, precision=None):
+    """
+    Cut sequences of vertices into arcs and deduplicate them
+
+    Returns the list of arcs, as (N, 2) arrays, and for each sequence the
+    array of its arc references: i for arc i, ~i for arc i reversed, or
+    None for rings of less than 3 vertices and lines of less than 2.
+    """
+    if not sequences:
+        return [], []
+    lengths = np.array([len(s) for s in sequences])
+    vertices = np.concatenate([np.reshape(s, (-1, 2)) for s in sequences])
+    vertices = vertices.astype(float)
+    if precision is not None:
+        vertices = np.round(vertices, precision)
+    seq = np.repeat(np.arange(len(sequences)), lengths)
+
+    # Drop repeated vertices, which rounding may create, and the closing
+    # vertex of rings, then the sequences left too short
+    keep = np.ones(len(vertices), dtype=bool)
+    keep[1:] = ((vertices[1:] != vertices[:-1]).any(axis=1)
+                | (seq[1:] != seq[:-1]))
+    vertices, seq = vertices[keep], seq[keep]
+    lengths = np.bincount(seq, minlength=len(sequences))
+    last = np.cumsum(lengths) - 1
+    rings = np.flatnonzero(closed & (lengths > 1))
+    starts = last[rings] - lengths[rings] + 1
+    closing = rings[(vertices[starts] == vertices[last[rings]]).all(axis=1)]
+    keep = np.ones(len(vertices), dtype=bool)
+    keep[last[closing]] = False
+    lengths[closing] -= 1
+    valid = lengths >= np.where(closed, 3, 2)
+    keep &= valid[seq]
+    vertices = vertices[keep]
+    closed, lengths = closed[valid], lengths[valid]
+    if not len(lengths):
+        return [], [None] * len(sequences)
+
+    offsets = np.cumsum(lengths) - lengths
+    _, ids = _unique_rows(vertices)
+    seq = np.repeat(np.arange(len(lengths)), lengths)
+    pos = np.arange(len(vertices)) - offsets[seq]
+    n = lengths[seq]
+    ring = closed[seq]
+
+    # A vertex is a junction if it has different neighbors in two places,
+    # or is the end of a line.
+    first = pos == 0
+    last = pos == n - 1
+    prev = ids[offsets[seq] + (pos - 1) % n]
+    next_ = ids[offsets[seq] + (pos + 1) % n]
+    prev[first & ~ring] = -1
+    next_[last & ~ring] = -1
+    neighbors = np.column_stack([ids, np.minimum(prev, next_),
+                                 np.maximum(prev, next_)])
+    distinct, _ = _unique_rows(neighbors)
+    junction = np.bincount(distinct[:, 0], minlength=ids.max() + 1) > 1
+    junction[ids[(first | last) & ~ring]] = True
+    is_junction = junction[ids]
+
+    # Rings start at their first junction, or without junctions at their
+    # smallest vertex id so that equal rings start at the same vertex.
+    big = len(vertices)
+    first_junction = np.minimum.reduceat(np.where(is_junction, pos, big),
+                                         offsets)
+    min_id = np.minimum.reduceat(ids, offsets)
+    min_pos = np.minimum.reduceat(np.where(ids == min_id[seq], pos, big),
+                                  offsets)
+    start = np.where(first_junction < big, first_junction, min_pos)
+    start[~closed] = 0
+
+    # Rotate the rings and close them by repeating their start
+    ext_lengths = lengths + closed
+    ext_offsets = np.cumsum(ext_lengths) - ext_lengths
+    ext_seq = np.repeat(np.arange(len(lengths)), ext_lengths)
+    ext_pos = np.arange(ext_lengths.sum()) - ext_offsets[ext_seq]
+    source = offsets[ext_seq] + (ext_pos + start[ext_seq]) % lengths[ext_seq]
+    ext_ids = ids[source]
+
+    # Arcs run between consecutive cuts of a sequence
+    cut = is_junction[source]
+    cut[ext_offsets] = True
+    cut[ext_offsets + ext_lengths - 1] = True
+    cuts = np.flatnonzero(cut)
+    same = ext_seq[cuts[:-1]] == ext_seq[cuts[1:]]
+    arc_start, arc_end = cuts[:-1][same], cuts[1:][same]
+    arc_seq = ext_seq[arc_start]
+
+    # Each arc is read in the direction starting with the smaller
+    # vertex ids, and identified by its length, ends and a hash of its ids.
+    head = np.column_stack([ext_ids[arc_start], ext_ids[arc_start + 1]])
+    tail = np.column_stack([ext_ids[arc_end], ext_ids[arc_end - 1]])
+    forward = ((head[:, 0] < tail[:, 0])
+               | ((head[:, 0] == tail[:, 0]) & (head[:, 1] <= tail[:, 1])))
+    arc_lengths = arc_end - arc_start + 1
+    arc_offsets = np.cumsum(arc_lengths) - arc_lengths
+    arc_of = np.repeat(np.arange(len(arc_start)), arc_lengths)
+    step = np.arange(arc_lengths.sum()) - arc_offsets[arc_of]
+    along = np.where(forward[arc_of], arc_start[arc_of] + step,
+                     arc_end[arc_of] - step)
+    powers = np.cumprod(np.full(arc_lengths.max(), _hash_base))
+    with np.errstate(over='ignore'):
+        hashes = np.add.reduceat(
+            ext_ids[along].astype(np.uint64) * powers[step], arc_offsets)
+    keys = np.column_stack([arc_lengths, ext_ids[along[arc_offsets]],
+                            ext_ids[along[arc_offsets + arc_lengths - 1]],
+                            hashes.view(np.int64)])
+    _, arc_ids = _unique_rows(keys)
+    arc_ids = _split_collisions(arc_ids, ext_ids[along], arc_offsets,
+                                arc_lengths)
+
+    # Store the first occurrence of each arc
+    first_arc = np.full(arc_ids.max() + 1, len(arc_ids))
+    np.minimum.at(first_arc, arc_ids, np.arange(len(arc_ids)))
+    stored = np.isin(arc_of, first_arc)
+    coords = vertices[source[along[stored]]]
+    ends = np.cumsum(arc_lengths[first_arc])
+    arcs = [coords[a:b] for a, b in zip(ends - arc_lengths[first_arc], ends)]
+
+    references = np.where(forward, arc_ids, ~arc_ids).astype(np.int32)
+    counts = np.bincount(arc_seq, minlength=len(lengths))
+    ends = np.cumsum(counts)
+    refs = iter([references[a:b] for a, b in zip(ends - counts, ends)])
+    return arcs, [next(refs) if v else None for v in valid]
+
+
+def _split_collisions(arc_ids, ids, offsets, lengths):
+    """
+    Renumber the arcs given the same id by their key that differ
+
+    The hash of a key groups the arcs that may be equal, but different
+    arcs may have the same hash. Each arc is compared with the first one
+    of its group, vertex by vertex, and the groups where some differ are
+    split by their vertex ids.
+    """
+    first = np.full(arc_ids.max() + 1, len(arc_ids))
+    np.minimum.at(first, arc_ids, np.arange(len(arc_ids)))
+    arc_of = np.repeat(np.arange(len(arc_ids)), lengths)
+    step = np.arange(len(ids)) - offsets[arc_of]
+    differs = ids != ids[offsets[first[arc_ids]][arc_of] + step]
+    if not differs.any():
+        return arc_ids
+    candidates = np.flatnonzero(np.isin(arc_ids, arc_ids[arc_of[differs]]))
+    rows = np.full((len(candidates), lengths[candidates].max()), -1)
+    vertices = np.isin(arc_of, candidates)
+    rows[np.searchsorted(candidates, arc_of[vertices]),
+         step[vertices]] = ids[vertices]
+    exact = np.zeros(len(arc_ids), dtype=np.int64)
+    exact[candidates] = _unique_rows(rows)[1] + 1
+    return _unique_rows(np.column_stack([arc_ids, exact]))[1]
+
+
+def _quantize(topo, precision):
+    """Quantize the positions of a topology, delta encoding its arcs"""
+    arcs = topo['arcs']
+    points = [g['coordinates'] for g in
+              topo['objects']['figure']['geometries'] if 'coordinates' in g]
+    positions = arcs + [np.reshape(p, (-1, 2)) for p in points]
+    scale = 10.0 ** -precision
+    translate = (np.concatenate(positions).min(axis=0) if positions
+                 else np.zeros(2))
+
+    def grid(p):
+        return np.round((np.asarray(p) - translate) / scale).astype(np.int64)
+
+    if arcs:
+        lengths = [len(arc) for arc in arcs]
+        starts = np.cumsum(lengths) - lengths
+        quantized = grid(np.concatenate(arcs))
+        steps = np.diff(quantized, axis=0, prepend=quantized[:1])
+        steps[starts] = quantized[starts]
+        if np.abs(steps).max() < 2 ** 31:
+            steps = steps.astype(np.int32)
+        topo['arcs'] = [steps[a:b] for a, b in
+                        zip(starts, np.append(starts[1:], len(steps)))]
+    for geometry in topo['objects']['figure']['geometries']:
+        if 'coordinates' in geometry:
+            geometry['coordinates'] = grid(geometry['coordinates'])
+    topo['transform'] = {"scale": [scale, scale],
+                         "translate": translate.tolist()}
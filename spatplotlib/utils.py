@@ -1,9 +1,12 @@
+import base64
+import io
 import itertools
 import json
 from json.encoder import JSONEncoder
 import warnings
 
 import matplotlib
+import matplotlib.image
 from matplotlib.axis import XAxis, YAxis
 from matplotlib import ticker
 from matplotlib.colors import colorConverter
@@ -35,6 +38,14 @@ PATH_DICT = {Path.LINETO: 'L',
              Path.CLOSEPOLY: 'Z'}
 
 
+# Lookup tables indexed by matplotlib path code: the SVG letter, and the
+# number of vertices in one segment (curves repeat their code per vertex).
+_CODE_LETTERS = np.full(Path.CLOSEPOLY + 1, '', dtype='<U1')
+_CODE_LETTERS[list(PATH_DICT)] = list(PATH_DICT.values())
+_CODE_STEPS = np.ones(Path.CLOSEPOLY + 1, dtype=np.intp)
+_CODE_STEPS[[Path.CURVE3, Path.CURVE4]] = [2, 3]
+
+
 def SVG_path(path, transform=None, simplify=False):
     """Construct the vertices and SVG codes for the path
 
@@ -59,6 +70,28 @@ def SVG_path(path, transform=None, simplify=False):
     if transform is not None:
         path = path.transformed(transform)
 
+    vertices = np.asarray(path.vertices, dtype=float)
+    codes = path.codes
+    if codes is None:
+        if not simplify and np.isfinite(vertices).all():
+            if not len(vertices):
+                return np.zeros((0, 2)), []
+            return vertices.copy(), ['M'] + ['L'] * (len(vertices) - 1)
+    else:
+        codes = np.asarray(codes)
+        keep = codes != Path.CLOSEPOLY
+        if (not simplify and np.isin(codes, list(PATH_DICT)).all()
+                and np.isfinite(vertices[keep]).all()):
+            # A segment starts at every vertex, except inside curves, where
+            # it starts every 2 (CURVE3) or 3 (CURVE4) vertices of a run.
+            index = np.arange(len(codes))
+            new_run = np.ones(len(codes), dtype=bool)
+            new_run[1:] = codes[1:] != codes[:-1]
+            run_start = np.maximum.accumulate(np.where(new_run, index, 0))
+            starts = (index - run_start) % _CODE_STEPS[codes] == 0
+            return vertices[keep], _CODE_LETTERS[codes[starts]].tolist()
+
+    # NaNs, STOP codes and simplification are left to matplotlib
     vc_tuples = [(vertices if path_code != Path.CLOSEPOLY else [],
                   PATH_DICT[path_code])
                  for (vertices, path_code)
@@ -218,24 +251,214 @@ def get_line_style(line):
     )
 
 
+# Number of vertices consumed by each path code understood by iter_rings
+_RING_CODE_VERTICES = {'M': 1, 'L': 1, 'S': 2, 'Z': 0}
+
+
+def image_to_base64(image):
+    """
+    Convert a matplotlib image to a base64 png representation
+
+    The png has the pixels of the image array, colormapped, with row 0 at
+    the top for origin='upper' and at the bottom for origin='lower'.
+
+    Parameters
+    ----------
+    image : matplotlib image object
+        The image to be converted.
+
+    Returns
+    -------
+    image_base64 : string
+        The UTF8-encoded base64 string representation of the png image.
+    """
+    rgba = image.to_rgba(image.get_array(), bytes=True)
+    if image.origin == 'lower':
+        rgba = rgba[::-1]
+    buffer = io.BytesIO()
+    matplotlib.image.imsave(buffer, rgba, format='png')
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
 def iter_rings(data, pathcodes):
-    ring = []
-    # TODO: Do this smartly by finding when pathcodes changes value and do
-    # smart indexing on data, instead of iterating over each coordinate
-    for point, code in zip(data, pathcodes):
-        if code == 'M':
-            # Emit the path and start a new one
-            if len(ring):
-                yield ring
-            ring = [point]
-        elif code == 'L' or code == 'Z' or code == 'S':
-            ring.append(point)
-        else:
-            raise ValueError('Unrecognized code: {}'.format(code))
+    """Yield the rings of a path as views of data, splitting at 'M' codes"""
+    codes = np.asarray(pathcodes, dtype='<U1')
+    counts = np.full(len(codes), -1)
+    for code, n in _RING_CODE_VERTICES.items():
+        counts[codes == code] = n
+    if (counts < 0).any():
+        raise ValueError('Unrecognized code: {}'.format(
+            codes[np.argmax(counts < 0)]))
+
+    ends = np.cumsum(counts)
+    data = np.asarray(data)[:ends[-1] if len(ends) else 0]
+    for ring in np.split(data, (ends - counts)[codes == 'M']):
+        if len(ring):
+            yield ring
+
+
+def split_polygons(rings):
+    """Group the rings of a filled path into polygons
+
+    Rings turning the same way as the first one (counterclockwise for
+    contourf) are shells, and the others are holes of the shell before
+    them. The signed areas of all rings are computed at once.
+
+    Returns a list of polygons, each a list of its shell and holes.
+    """
+    lengths = np.array([len(ring) for ring in rings])
+    starts = np.cumsum(lengths) - lengths
+    vertices = np.concatenate(rings)
+    following = np.roll(vertices, -1, axis=0)
+    following[starts + lengths - 1] = vertices[starts]
+    cross = (vertices[:, 0] * following[:, 1]
+             - following[:, 0] * vertices[:, 1])
+    area = np.add.reduceat(cross, starts)
+    shell = np.sign(area) == np.sign(area[0])
+    shell[0] = True
+    bounds = np.append(np.flatnonzero(shell), len(rings))
+    return [list(rings[a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def simplify_coords(coords, tolerance):
+    """Simplify a line with the Douglas-Peucker algorithm
+
+    All the intervals still to be split are processed together, so each
+    level of the recursion is a handful of NumPy operations.
+
+    Parameters
+    ----------
+    coords : array_like
+        The shape (N, 2) array of vertices. A closed ring (first vertex equal
+        to the last) stays closed.
+    tolerance : float
+        Vertices closer than this to the simplified line are removed.
+
+    Returns
+    -------
+    coords : array
+        The retained vertices, always including the first and the last.
+    """
+    coords = np.asarray(coords, dtype=float)
+    if len(coords) < 3 or not tolerance > 0:
+        return coords
+
+    keep = np.zeros(len(coords), dtype=bool)
+    keep[[0, -1]] = True
+    first, last = np.array([0]), np.array([len(coords) - 1])
+    while len(first):
+        # Index every vertex strictly inside each interval
+        counts = last - first - 1
+        offsets = np.cumsum(counts) - counts
+        interval = np.repeat(np.arange(len(first)), counts)
+        inner = (np.arange(counts.sum()) - offsets[interval]
+                 + first[interval] + 1)
+        dist = _segment_distance(coords[inner], coords[first][interval],
+                                 coords[last][interval])
+
+        # Split each interval at its farthest vertex if that is too far
+        farthest = np.maximum.reduceat(dist, offsets)
+        split = farthest > tolerance
+        candidates = np.flatnonzero(split[interval]
+                                    & (dist == farthest[interval]))
+        first_candidate = np.ones(len(candidates), dtype=bool)
+        first_candidate[1:] = np.diff(interval[candidates]) != 0
+        pivot = inner[candidates[first_candidate]]
+        keep[pivot] = True
+        first = np.concatenate([first[split], pivot])
+        last = np.concatenate([pivot, last[split]])
+        has_inner = last - first > 1
+        first, last = first[has_inner], last[has_inner]
+
+    return coords[keep]
+
+
+def simplify_rings(rings, polygon, tolerance):
+    """Simplify the rings of a path with simplify_coords
+
+    Polygon rings are closed before simplification so they stay closed.
+    Holes that collapse to fewer than three distinct vertices are dropped,
+    and so is the whole polygon (an empty list is returned) if its outer
+    ring collapses.
+    """
+    simplified = []
+    for i, ring in enumerate(rings):
+        if polygon and not np.array_equal(ring[0], ring[-1]):
+            ring = np.concatenate([ring, ring[:1]])
+        ring = simplify_coords(ring, tolerance)
+        if polygon and len(ring) < 4:
+            if i == 0:
+                return []
+            continue
+        simplified.append(ring)
+    return simplified
+
+
+def _segment_distance(p, a, b):
+    """Distance from each point of p to the segment from a to b"""
+    ab = b - a
+    ap = p - a
+    length2 = (ab ** 2).sum(axis=1)
+    t = np.divide((ap * ab).sum(axis=1), length2,
+                  out=np.zeros_like(length2), where=length2 > 0)
+    return np.hypot(*(ap - np.clip(t, 0, 1)[:, None] * ab).T)
+
+
+
+_MAX_LATITUDE = 85.0511287798
+
+
+def web_mercator(lonlat):
+    """Project lon/lat to Web Mercator world coordinates in [0, 1]"""
+    lonlat = np.asarray(lonlat, dtype=float).reshape(-1, 2)
+    lat = np.radians(np.clip(lonlat[:, 1], -_MAX_LATITUDE, _MAX_LATITUDE))
+    x = (lonlat[:, 0] + 180) / 360
+    y = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2
+    return np.column_stack([x, y])
 
-    if len(ring):
-        yield ring
 
+def web_mercator_inverse(world):
+    """Unproject Web Mercator world coordinates to lon/lat"""
+    lon = world[:, 0] * 360 - 180
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * world[:, 1]))))
+    return np.column_stack([lon, lat])
+
+
+def cluster_points(world, colors, radius, maxzoom):
+    """Cluster points on a grid for each Leaflet zoom level
+
+    Points (in Web Mercator world coordinates) are grouped by grid cells of
+    radius screen pixels, starting at maxzoom. Each coarser zoom level
+    groups the clusters of the level below it, so the clusters nest.
+
+    Returns a list indexed by zoom level of (centroids, counts, colors),
+    where colors is the mean of the colors of the points in each cluster.
+    It stops at the last zoom level where clusters hold two points or more
+    on average: past that, there are few enough points per cell to show
+    them individually.
+    """
+    world = np.asarray(world, dtype=float)
+    centroids, counts = world, np.ones(len(world))
+    colors = np.asarray(colors, dtype=float)
+    levels = []
+    for zoom in range(maxzoom, -1, -1):
+        scale = 256 * 2 ** zoom / radius
+        cells = np.floor(centroids * scale).astype(np.int64)
+        ids = cells[:, 0] * (int(scale) + 2) + cells[:, 1]
+        _, inverse = np.unique(ids, return_inverse=True)
+        size = inverse.max() + 1 if len(inverse) else 0
+        weights = np.bincount(inverse, counts, size)
+        centroids = np.column_stack([
+            np.bincount(inverse, centroids[:, i] * counts, size)
+            for i in range(2)]) / weights[:, None]
+        colors = np.column_stack([
+            np.bincount(inverse, colors[:, i] * counts, size)
+            for i in range(colors.shape[1])]) / weights[:, None]
+        counts = weights
+        levels.append((centroids, counts, colors))
+    levels.reverse()
+    merged = [2 * len(counts) <= len(world) for _, counts, _ in levels]
+    return levels[:sum(merged)]
 
 def get_figure_properties(fig):
     return dict(
@@ -388,9 +611,46 @@ def get_axes_properties(ax):
     return props
 
 
+def to_builtins(o):
+    """
+    Convert the NumPy arrays and scalars in nested dictionaries and lists
+    to lists and Python numbers, as the json module expects
+    """
+    if isinstance(o, dict):
+        return {key: to_builtins(value) for key, value in o.items()}
+    if isinstance(o, (list, tuple)):
+        return [to_builtins(value) for value in o]
+    if isinstance(o, (np.ndarray, np.generic)):
+        return o.tolist()
+    return o
+
+
 class FloatEncoder(JSONEncoder):
+    """
+    JSON encoder writing floats at a fixed precision
+
+    The precision is set per instance, e.g. json.dumps(o, cls=FloatEncoder,
+    precision=6), and defaults to the class attribute _formatter. Floats
+    are formatted by the pure Python encoder of the json module, which is
+    slow for large arrays (see ArrayEncoder).
+    """
     _formatter = ".3f"
 
+    def __init__(self, *, precision=None, **kwargs):
+        super().__init__(**kwargs)
+        if precision is None:
+            self.formatter = self._formatter
+        else:
+            self.formatter = ".{}f".format(precision)
+
+    def default(self, o):
+        # Renderers keep coordinates as NumPy arrays until serialization
+        if isinstance(o, np.ndarray):
+            return o.tolist()
+        if isinstance(o, np.generic):
+            return o.item()
+        return super().default(o)
+
     def iterencode(self, o, _one_shot=False):
         """Encode the given object and yield each string
         representation as available.
@@ -398,9 +658,6 @@ class FloatEncoder(JSONEncoder):
             for chunk in JSONEncoder().iterencode(bigobject):
                 mysocket.write(chunk)
         """
-        c_make_encoder_original = json.encoder.c_make_encoder
-        json.encoder.c_make_encoder = None
-
         if self.check_circular:
             markers = {}
         else:
@@ -411,7 +668,7 @@ class FloatEncoder(JSONEncoder):
             _encoder = json.encoder.encode_basestring
 
         def floatstr(o, allow_nan=self.allow_nan,
-                     _repr=lambda x: format(x, self._formatter),
+                     _repr=lambda x, f=self.formatter: format(x, f),
                      _inf=float("inf"), _neginf=-float("inf")):
             # Check for specials.  Note that this type of test is processor
             # and/or platform-specific, so do tests which don't depend on the
@@ -432,16 +689,289 @@ class FloatEncoder(JSONEncoder):
 
             return text
 
-        if (_one_shot and json.encoder.c_make_encoder is not None
-                and self.indent is None):
-            _iterencode = json.encoder.c_make_encoder(
-                markers, self.default, _encoder, self.indent,
-                self.key_separator, self.item_separator, self.sort_keys,
-                self.skipkeys, self.allow_nan)
+        # The C encoder formats floats with repr(), so the pure Python one
+        # is always used, without changing the json module.
+        _iterencode = json.encoder._make_iterencode(
+            markers, self.default, _encoder, self.indent, floatstr,
+            self.key_separator, self.item_separator, self.sort_keys,
+            self.skipkeys, _one_shot)
+        return _iterencode(o, 0)
+
+
+class ArrayEncoder(JSONEncoder):
+    """
+    JSON encoder writing NumPy arrays and floats at a fixed precision
+
+    Numeric arrays of one or two dimensions are formatted in batches with
+    NumPy, as integers scaled by 10**precision whose digits are written
+    into a byte matrix, instead of one float at a time. The output is
+    streamed by iterencode() (and json.dump) in chunks of about batch_size
+    numbers. Other values are encoded like json.dumps does, except that
+    indent is not supported and circular references are not checked.
+
+    Floats are rounded like format(x, '.{precision}f'), except for values
+    within an ulp of halfway between two outputs, where the last digit may
+    differ. Arrays with non-finite values, or too large for int64 at this
+    precision, are formatted one number at a time.
+
+    Parameters
+    ----------
+    precision : int, default 6
+        Number of decimals of floats
+    batch_size : int, default 2**18
+        Number of array values formatted at once
+    **kwargs
+        Passed to json.JSONEncoder, e.g. separators
+    """
+    # Containers are walked by a generator, so that the output can be
+    # streamed between their items, down to this depth (the features of a
+    # FeatureCollection), and encoded recursively below it.
+    _stream_depth = 2
+
+    def __init__(self, *, precision=6, batch_size=1 << 18, **kwargs):
+        super().__init__(**kwargs)
+        if self.indent is not None:
+            raise ValueError("ArrayEncoder does not support indent")
+        self.precision = precision
+        self.batch_size = batch_size
+
+    def default(self, o):
+        if isinstance(o, np.generic):
+            return o.item()
+        return super().default(o)
+
+    def iterencode(self, o, _one_shot=False):
+        # Values are appended to the chunk as text, and numeric arrays as
+        # themselves, to be formatted together when the chunk is written.
+        chunk, arrays = [], []
+        numbers = 0
+        append = chunk.append
+        if self.ensure_ascii:
+            string = json.encoder.encode_basestring_ascii
+        else:
+            string = json.encoder.encode_basestring
+        item_separator = self.item_separator
+        key_separator = self.key_separator
+
+        def members(o):
+            """Brackets of a container, and its items with their prefix,
+            for stream()"""
+            if isinstance(o, dict):
+                items = sorted(o.items()) if self.sort_keys else o.items()
+                keyed = [(string(key) + key_separator, value)
+                         for key, value in ((self._key(key), value)
+                                            for key, value in items)
+                         if key is not None]
+                return '{', '}', [((item_separator if i else '') + key, value)
+                                  for i, (key, value) in enumerate(keyed)]
+            return '[', ']', [(item_separator if i else '', value)
+                              for i, value in enumerate(o)]
+
+        def encode(o):
+            nonlocal numbers
+            if isinstance(o, str):
+                append(string(o))
+            elif o is None:
+                append('null')
+            elif o is True:
+                append('true')
+            elif o is False:
+                append('false')
+            elif isinstance(o, int):
+                append(int.__repr__(o))
+            elif isinstance(o, float):
+                append(self._floatstr(o))
+            elif isinstance(o, dict):
+                append('{')
+                first = True
+                items = sorted(o.items()) if self.sort_keys else o.items()
+                for key, value in items:
+                    if not isinstance(key, str):
+                        key = self._key(key)
+                        if key is None:
+                            continue
+                    if first:
+                        first = False
+                    else:
+                        append(item_separator)
+                    append(string(key))
+                    append(key_separator)
+                    encode(value)
+                append('}')
+            elif isinstance(o, (list, tuple)):
+                append('[')
+                first = True
+                for value in o:
+                    if first:
+                        first = False
+                    else:
+                        append(item_separator)
+                    encode(value)
+                append(']')
+            elif isinstance(o, np.ndarray):
+                if o.dtype.kind in 'fiu' and o.ndim in (1, 2) and o.size:
+                    arrays.append(len(chunk))
+                    append(o)
+                    numbers += o.size
+                elif o.ndim > 2:
+                    encode(list(o))
+                else:
+                    encode(o.tolist())
+            else:
+                encode(self.default(o))
+
+        def stream(o, depth):
+            if (depth >= self._stream_depth
+                    or not isinstance(o, (dict, list, tuple))):
+                encode(o)
+                yield
+                return
+            start, end, items = members(o)
+            append(start)
+            for prefix, value in items:
+                append(prefix)
+                yield from stream(value, depth + 1)
+            append(end)
+
+        for _ in stream(o, 0):
+            if numbers >= self.batch_size or len(chunk) >= self.batch_size:
+                text = self._join(chunk, arrays)
+                chunk.clear()
+                arrays.clear()
+                numbers = 0
+                yield text
+        if chunk:
+            yield self._join(chunk, arrays)
+
+    def _floatstr(self, o):
+        if o != o:
+            text = 'NaN'
+        elif o == float('inf'):
+            text = 'Infinity'
+        elif o == -float('inf'):
+            text = '-Infinity'
         else:
-            _iterencode = json.encoder._make_iterencode(
-                markers, self.default, _encoder, self.indent, floatstr,
-                self.key_separator, self.item_separator, self.sort_keys,
-                self.skipkeys, _one_shot)
-        json.encoder.c_make_encoder = c_make_encoder_original
-        return _iterencode(o, 0)
\ No newline at end of file
+            return format(o, '.{}f'.format(self.precision))
+        if not self.allow_nan:
+            raise ValueError("Out of range float values are not JSON "
+                             "compliant: " + repr(o))
+        return text
+
+    def _key(self, key):
+        """Text of a dictionary key, or None if it is skipped"""
+        if isinstance(key, str):
+            return key
+        if isinstance(key, float):
+            return self._floatstr(key)
+        if key is True or key is False or key is None:
+            return json.dumps(key)
+        if isinstance(key, int):
+            return int.__repr__(key)
+        if self.skipkeys:
+            return None
+        raise TypeError('keys must be str, int, float, bool or None, not {}'
+                        .format(type(key).__name__))
+
+    def _join(self, chunk, arrays):
+        """Text of a chunk, formatting its arrays of floats and its arrays
+        of integers in one batch each"""
+        floats = [i for i in arrays if chunk[i].dtype.kind == 'f']
+        integers = [i for i in arrays if chunk[i].dtype.kind != 'f']
+        for index, places in ((floats, self.precision), (integers, 0)):
+            if not index:
+                continue
+            texts = _format_arrays([chunk[i] for i in index], places,
+                                   self.item_separator)
+            for i, text in zip(index, texts):
+                # Arrays that cannot be scaled to int64 are left to Python
+                chunk[i] = (text if text is not None else
+                            ''.join(self.iterencode(chunk[i].tolist())))
+        return ''.join(chunk)
+
+
+def _format_arrays(arrays, places, separator=', '):
+    """
+    Format non-empty numeric arrays of 1 or 2 dimensions as JSON arrays
+
+    The values are scaled to integers with the given number of decimal
+    places, and all numbers are written at once into a byte matrix, one
+    row per number: its opening brackets, its digits right-aligned, and its
+    closing brackets or separator. Masking out the padding and flattening
+    the matrix gives the text of all arrays, one after another. Arrays
+    with values that do not fit in int64 once scaled give None.
+    """
+    sizes = np.array([a.size for a in arrays])
+    offsets = np.cumsum(sizes) - sizes
+    values = np.concatenate([a.ravel() for a in arrays])
+    if values.dtype.kind == 'f':
+        negative = np.signbit(values)
+        magnitude = np.abs(values) * 10.0 ** places
+        # Also true for NaN and infinities
+        invalid = ~(magnitude < 2 ** 53)
+        magnitude = np.rint(np.where(invalid, 0, magnitude)).astype(np.int64)
+    else:
+        negative = values < 0
+        invalid = values > np.iinfo(np.int64).max
+        magnitude = np.abs(np.where(invalid, 0, values).astype(np.int64))
+
+    # Brackets and separators around each number
+    array = np.repeat(np.arange(len(arrays)), sizes)
+    position = np.arange(len(values)) - offsets[array]
+    columns = np.array([a.shape[1] if a.ndim == 2 else a.size
+                        for a in arrays])[array]
+    nested = np.array([a.ndim == 2 for a in arrays])[array]
+    last = position == sizes[array] - 1
+    column = position % columns
+    # Prefixes: '', '[', '[['
+    prefix = np.where(position == 0, 1 + nested, nested & (column == 0))
+    # Suffixes: separator, ']', ']' + separator, ']]'
+    suffix = np.where(last, 1 + 2 * nested,
+                      2 * (nested & (column == columns - 1)))
+    prefixes, prefix_lengths = _byte_table(['', '[', '[['])
+    suffixes, suffix_lengths = _byte_table([separator, ']', ']' + separator,
+                                            ']]'])
+
+    # Digits, right-aligned, with the decimal point and sign
+    scale = 10 ** places
+    powers = 10 ** np.arange(1, 19, dtype=np.int64)
+    int_digits = np.searchsorted(powers, magnitude // scale, side='right') + 1
+    lengths = int_digits + (places + 1 if places else 0) + negative
+    width = lengths.max()
+    pre, post = prefixes.shape[1], suffixes.shape[1]
+
+    # One row per character position, transposed at the end
+    text = np.empty((pre + width + post, len(values)), dtype=np.uint8)
+    text[:pre] = prefixes[prefix].T
+    text[pre + width:] = suffixes[suffix].T
+    rest = magnitude
+    for i in range(pre + width - 1, pre - 1, -1):
+        if places and i == pre + width - 1 - places:
+            text[i] = ord('.')
+            continue
+        quotient = rest // 10
+        text[i] = 48 + (rest - 10 * quotient)
+        rest = quotient
+    rows = np.arange(len(values))
+    text[(pre + width - lengths)[negative], rows[negative]] = ord('-')
+
+    mask = np.empty(text.shape, dtype=bool)
+    index = np.arange(max(pre, width, post))[:, None]
+    mask[:pre] = index[:pre] < prefix_lengths[prefix]
+    mask[pre:pre + width] = index[:width] >= width - lengths
+    mask[pre + width:] = index[:post] < suffix_lengths[suffix]
+    text, mask = text.T, mask.T
+    lengths = np.add.reduceat(mask.sum(axis=1), offsets)
+    text = text[mask].tobytes().decode('ascii')
+    ends = np.cumsum(lengths)
+    invalid = np.logical_or.reduceat(invalid, offsets)
+    return [None if bad else text[start:end]
+            for start, end, bad in zip(ends - lengths, ends, invalid)]
+
+
+def _byte_table(strings):
+    """Byte matrix of strings, left-aligned, and their lengths"""
+    lengths = np.array([len(s) for s in strings])
+    table = np.zeros((len(strings), lengths.max()), dtype=np.uint8)
+    for i, s in enumerate(strings):
+        table[i, :len(s)] = np.frombuffer(s.encode('ascii'), dtype=np.uint8)
+    return table, lengths
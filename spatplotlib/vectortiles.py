@@ -0,0 +1,456 @@
+"""
+Vector Tiles
+============
+Export a figure as a static z/x/y pyramid of GeoJSON tiles with a Leaflet
+viewer, for figures too large to embed in a single HTML file. Images are
+written as pyramids of PNG tiles (see rasters).
+
+Features are simplified for each zoom level and clipped to the tiles they
+touch by splitting the tile range in halves, so each vertex is clipped
+O(log(tiles)) times. Tiles carry a buffer around their edges, and the viewer
+draws every tile on its own canvas, which hides the buffer again.
+"""
+import functools
+import http.server
+import json
+import os
+import sys
+import uuid
+import webbrowser
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from .exporter import Exporter
+from .leaflet_renderer import LeafletRenderer
+from .display import _leaflet_js, _leaflet_css, _attribution
+from .utils import simplify_rings, web_mercator, web_mercator_inverse
+from .rasters import write_pyramid
+from . import maptiles, htmltiles
+
+_tile_size = 256
+# Rough number of vertices handed to a worker in one task
+_chunk_vertices = 200000
+
+
+def fig_to_tiles(fig=None, outdir='_tiles', minzoom=0, maxzoom=12,
+                 tiles=None, crs=None, epsg=None, simplify=1.0, buffer=64,
+                 float_precision=6, processes=None, embed_links=False):
+    """
+    Convert a Matplotlib Figure to a directory of GeoJSON vector tiles
+
+    The tiles are written to outdir/{z}/{x}/{y}.geojson together with a
+    viewer page, outdir/index.html, which loads the tiles in view. Images
+    are written to outdir/images/{i}/{z}/{x}/{y}.png, up to the zoom level
+    of their resolution. The
+    directory can be served by any static file server, or by serve_tiles().
+    Browsers refuse to fetch tiles for pages opened from the filesystem.
+
+    Parameters
+    ----------
+    fig : figure, default gcf()
+        Figure used to convert to tiles
+    outdir : string, default '_tiles'
+        The directory to write the tiles and viewer to
+    minzoom, maxzoom : int, default 0 and 12
+        The range of zoom levels to generate tiles for. The viewer scales up
+        the maxzoom tiles when zoomed in further.
+    tiles : string or tuple
+        The base map tiles of the viewer. See fig_to_html().
+    crs : dict, default assumes lon/lat
+        pyproj definition of the current figure. See fig_to_html().
+    epsg : int, default 4326
+        The EPSG code of the current plot. See fig_to_html().
+    simplify : float, default 1.0
+        Lines and polygons are simplified at each zoom level, dropping
+        detail smaller than this many screen pixels.
+    buffer : int, default 64
+        Margin in pixels around each tile in which features are kept, so
+        that strokes and markers near the edges are drawn on both tiles.
+    float_precision : int, default 6
+        The precision to be used for the floats in the tiles.
+    processes : int, default None
+        Number of worker processes; None uses every core, and 1 generates
+        the tiles in the current process.
+    embed_links : bool, default False
+        Whether external links (except tiles) shall be explicitly embedded in
+        the viewer.
+
+    Returns
+    -------
+    Path of the viewer page
+    """
+    if not 0 <= buffer < _tile_size:
+        raise ValueError('buffer must be between 0 and {} pixels'
+                         .format(_tile_size))
+    tiles = maptiles.tiles[tiles] if tiles is not None else maptiles.osm
+
+    if fig is None:
+        fig = plt.gcf()
+    renderer = LeafletRenderer(crs=crs, epsg=epsg)
+    exporter = Exporter(renderer)
+    exporter.run(fig)
+    gj = renderer.geojson(images=False)
+
+    features = [f for f in map(_to_world, gj['features']) if f is not None]
+    tasks = [(z, chunk, simplify, buffer, float_precision)
+             for z in range(minzoom, maxzoom + 1)
+             for chunk in _chunks(features)]
+
+    # Results come back in task order, so features keep their drawing order
+    # within each tile. Tile files are appended to as chunks come in.
+    os.makedirs(outdir, exist_ok=True)
+    written = set()
+    if processes == 1:
+        results = map(_tile_chunk, tasks)
+        _write_fragments(outdir, results, written)
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = executor.map(_tile_chunk, tasks)
+            _write_fragments(outdir, results, written)
+    for path in written:
+        with open(path, 'a') as f:
+            f.write(']}')
+
+    images = []
+    for i, raster in enumerate(renderer.rasters):
+        path = os.path.join('images', str(i))
+        image = write_pyramid(raster, os.path.join(outdir, path), minzoom,
+                              maxzoom, processes)
+        if image is not None:
+            image['url'] = path.replace(os.sep, '/') + '/{z}/{x}/{y}.png'
+            images.append(image)
+
+    boxes = [image['bounds'] for image in images]
+    if features:
+        lo = np.min([f['bbox'][:2] for f in features], axis=0)
+        hi = np.max([f['bbox'][2:] for f in features], axis=0)
+        (west, north), (east, south) = web_mercator_inverse(
+            np.array([lo, hi]))
+        boxes.append([west, south, east, north])
+    if boxes:
+        boxes = np.array(boxes)
+        bounds = [*boxes[:, :2].min(axis=0), *boxes[:, 2:].max(axis=0)]
+    else:
+        bounds = None
+    meta = {
+        'minzoom': minzoom,
+        'maxzoom': maxzoom,
+        'bounds': bounds,
+        'symbols': gj['symbols'],
+        'images': images,
+    }
+    params = {
+        'meta': json.dumps(meta, default=_json_default),
+        'mapid': str(uuid.uuid4()).replace('-', ''),
+        'tile_url': tiles[0],
+        'attribution': _attribution + ' | ' + tiles[1],
+        'links': [_leaflet_js, _leaflet_css],
+        'embed_links': embed_links,
+    }
+    index = os.path.join(outdir, 'index.html')
+    with open(index, 'w') as f:
+        f.write(htmltiles.format(**params))
+    return index
+
+
+def serve_tiles(outdir='_tiles', port=8000, open_browser=True):
+    """
+    Serve a directory written by fig_to_tiles() on localhost until
+    interrupted. Also available as ``python -m spatplotlib.vectortiles``.
+
+    Parameters
+    ----------
+    outdir : string, default '_tiles'
+        The directory to serve
+    port : int, default 8000
+        The port to listen on; 0 picks a free one
+    open_browser : bool, default True
+        Open the viewer in a web browser
+    """
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler,
+                                directory=outdir)
+    with http.server.ThreadingHTTPServer(('127.0.0.1', port),
+                                         handler) as server:
+        url = 'http://127.0.0.1:{}/index.html'.format(server.server_address[1])
+        print('Serving {} at {}'.format(outdir, url))
+        if open_browser:
+            webbrowser.open(url)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def _to_world(feature):
+    """
+    Convert a feature of LeafletRenderer to world coordinates, as a dict
+    with its kind ('points', 'lines' or 'polygons'), geometry, properties
+    and bounding box. Returns None for empty geometries.
+    """
+    geometry = feature['geometry']
+    gtype, coords = geometry['type'], geometry['coordinates']
+    properties = feature['properties']
+    if gtype in ('Point', 'MultiPoint'):
+        kind = 'points'
+        geom = web_mercator(coords)
+        symbol = np.atleast_1d(properties['symbol'])
+        properties = {'symbol': symbol}
+        vertices = geom
+    elif gtype in ('LineString', 'MultiLineString'):
+        kind = 'lines'
+        parts = [coords] if gtype == 'LineString' else coords
+        geom = [web_mercator(part) for part in parts if len(part) > 1]
+        vertices = np.concatenate(geom) if geom else geom
+    elif gtype in ('Polygon', 'MultiPolygon'):
+        kind = 'polygons'
+        polygons = [coords] if gtype == 'Polygon' else coords
+        geom = [[web_mercator(ring) for ring in rings]
+                for rings in polygons if rings]
+        vertices = (np.concatenate([ring for rings in geom for ring in rings])
+                    if geom else geom)
+    else:
+        return None
+    if not len(vertices):
+        return None
+    bbox = np.concatenate([vertices.min(axis=0), vertices.max(axis=0)])
+    return {'kind': kind, 'geom': geom, 'properties': properties,
+            'bbox': bbox, 'size': len(vertices)}
+
+
+def _chunks(features):
+    """Group consecutive features into chunks of about _chunk_vertices"""
+    chunk, size = [], 0
+    for feature in features:
+        chunk.append(feature)
+        size += feature['size']
+        if size >= _chunk_vertices:
+            yield chunk
+            chunk, size = [], 0
+    if chunk:
+        yield chunk
+
+
+def _write_fragments(outdir, results, written):
+    for z, fragments in results:
+        for (x, y), texts in fragments.items():
+            path = os.path.join(outdir, str(z), str(x), '{}.geojson'.format(y))
+            if path not in written:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'w') as f:
+                    f.write('{"type": "FeatureCollection", "features": [')
+                    f.write(', '.join(texts))
+                written.add(path)
+            else:
+                with open(path, 'a') as f:
+                    f.write(', ' + ', '.join(texts))
+
+
+def _tile_chunk(task):
+    """
+    Simplify and clip a chunk of features to the tiles of one zoom level.
+
+    Returns the zoom level and a dict mapping (x, y) tile indices to the
+    GeoJSON text of the clipped features.
+    """
+    z, features, simplify, buffer, precision = task
+    n = 2 ** z
+    buf = buffer / _tile_size
+    out = defaultdict(list)
+
+    def dump(gtype, geom, properties):
+        return json.dumps({
+            "type": "Feature",
+            "geometry": {"type": gtype, "coordinates": geom},
+            "properties": properties,
+        }, default=_json_default)
+
+    def lonlat(part):
+        return np.round(web_mercator_inverse(part / n), precision).tolist()
+
+    for feature in features:
+        properties = feature['properties']
+        if feature['kind'] == 'points':
+            points = feature['geom'] * n
+            for (x, y), index in _tile_points(points, n, buf):
+                out[x, y].append(dump('MultiPoint', lonlat(points[index]), {
+                    'symbol': properties['symbol'][index]}))
+            continue
+
+        # Simplify in tile units, where a pixel is 1 / _tile_size
+        tolerance = simplify / _tile_size
+        polygon = feature['kind'] == 'polygons'
+        if polygon:
+            geom = [simplify_rings([ring * n for ring in rings], True,
+                                   tolerance)
+                    for rings in feature['geom']]
+            geom = [rings for rings in geom if rings]
+        else:
+            geom = [part for (part,) in
+                    (simplify_rings([part * n], False, tolerance)
+                     for part in feature['geom'])]
+        if not geom:
+            continue
+
+        x0, y0 = np.clip(np.floor(feature['bbox'][:2] * n - buf), 0, n - 1)
+        x1, y1 = np.clip(np.floor(feature['bbox'][2:] * n + buf), 0, n - 1)
+        geom = _clip(geom, polygon, (x0 - buf, y0 - buf,
+                                     x1 + 1 + buf, y1 + 1 + buf))
+        for (x, y), clipped in _split(geom, polygon, int(x0), int(x1),
+                                      int(y0), int(y1), buf):
+            if polygon:
+                coords = [[lonlat(ring) for ring in rings]
+                          for rings in clipped]
+                out[x, y].append(dump('MultiPolygon', coords, properties))
+            else:
+                coords = [lonlat(part) for part in clipped]
+                out[x, y].append(dump('MultiLineString', coords, properties))
+    return z, dict(out)
+
+
+def _tile_points(points, n, buf):
+    """
+    Yield the (x, y) of each tile and the indices of the points within its
+    buffered extent. Points are in tile units.
+    """
+    lo = np.floor(points - buf).astype(np.int64)
+    hi = np.floor(points + buf).astype(np.int64)
+    index = np.arange(len(points))
+    # A point is in at most two tiles along each axis
+    candidates = [(index, lo[:, 0], lo[:, 1])]
+    x_differs = hi[:, 0] != lo[:, 0]
+    y_differs = hi[:, 1] != lo[:, 1]
+    candidates.append((index[x_differs], hi[x_differs, 0], lo[x_differs, 1]))
+    candidates.append((index[y_differs], lo[y_differs, 0], hi[y_differs, 1]))
+    both = x_differs & y_differs
+    candidates.append((index[both], hi[both, 0], hi[both, 1]))
+    index, x, y = (np.concatenate(c) for c in zip(*candidates))
+
+    valid = (x >= 0) & (x < n) & (y >= 0) & (y < n)
+    index, x, y = index[valid], x[valid], y[valid]
+    # Group by tile, keeping the points in order within each tile
+    order = np.lexsort((index, y, x))
+    index, x, y = index[order], x[order], y[order]
+    starts = np.flatnonzero(np.r_[True, (np.diff(x) != 0) | (np.diff(y) != 0)])
+    for group in np.split(np.arange(len(index)), starts[1:]):
+        if len(group):
+            yield (int(x[group[0]]), int(y[group[0]])), index[group]
+
+
+def _split(geom, polygon, x0, x1, y0, y1, buf):
+    """
+    Yield the (x, y) of each tile in [x0, x1] x [y0, y1] with the geometry
+    clipped to its buffered extent, halving the range at each step. The
+    geometry must already be clipped to the buffered extent of the range.
+    """
+    if x0 == x1 and y0 == y1:
+        yield (x0, y0), geom
+        return
+    if x1 - x0 >= y1 - y0:
+        mid = (x0 + x1) // 2
+        halves = [(x0, mid, y0, y1), (mid + 1, x1, y0, y1)]
+    else:
+        mid = (y0 + y1) // 2
+        halves = [(x0, x1, y0, mid), (x0, x1, mid + 1, y1)]
+    for a0, a1, b0, b1 in halves:
+        clipped = _clip(geom, polygon, (a0 - buf, b0 - buf,
+                                        a1 + 1 + buf, b1 + 1 + buf))
+        if clipped:
+            yield from _split(clipped, polygon, a0, a1, b0, b1, buf)
+
+
+def _clip(geom, polygon, box):
+    """Clip a list of polygons (lists of rings) or of lines to a box"""
+    if polygon:
+        clipped = []
+        for rings in geom:
+            shell = _clip_ring(rings[0], box)
+            if shell is not None:
+                holes = (_clip_ring(ring, box) for ring in rings[1:])
+                clipped.append([shell] + [h for h in holes if h is not None])
+        return clipped
+    return [piece for line in geom for piece in _clip_line(line, box)]
+
+
+def _clip_ring(ring, box):
+    """
+    Clip a ring to a box (xmin, ymin, xmax, ymax) with the
+    Sutherland-Hodgman algorithm, one box edge at a time. Returns None if
+    fewer than three vertices are left.
+    """
+    for axis, bound, upper in ((0, box[0], False), (0, box[2], True),
+                               (1, box[1], False), (1, box[3], True)):
+        v = ring[:, axis]
+        inside = v <= bound if upper else v >= bound
+        if inside.all():
+            continue
+        if not inside.any():
+            return None
+        # Each vertex is kept if inside, followed by the intersection of
+        # its edge to the next vertex if that edge crosses the bound.
+        following = np.roll(ring, -1, axis=0)
+        crossing = inside != np.roll(inside, -1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (bound - v) / (following[:, axis] - v)
+            intersection = ring + t[:, None] * (following - ring)
+        intersection[:, axis] = bound
+
+        counts = inside.astype(np.intp) + crossing
+        position = np.cumsum(counts) - counts
+        out = np.empty((counts.sum(), 2))
+        out[position[inside]] = ring[inside]
+        out[(position + inside)[crossing]] = intersection[crossing]
+        ring = out
+    return ring if len(ring) >= 3 else None
+
+
+def _clip_line(line, box):
+    """
+    Clip a line to a box (xmin, ymin, xmax, ymax), clipping all segments at
+    once with the Liang-Barsky algorithm, and return the list of pieces.
+    """
+    a, d = line[:-1], np.diff(line, axis=0)
+    t0 = np.zeros(len(a))
+    t1 = np.ones(len(a))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for axis, lo, hi in ((0, box[0], box[2]), (1, box[1], box[3])):
+            p, q = d[:, axis], a[:, axis]
+            t_lo, t_hi = (lo - q) / p, (hi - q) / p
+            # Segments parallel to the bounds are either kept or rejected
+            parallel = np.where((q >= lo) & (q <= hi), -np.inf, np.inf)
+            t0 = np.maximum(t0, np.where(p > 0, t_lo,
+                                         np.where(p < 0, t_hi, parallel)))
+            t1 = np.minimum(t1, np.where(p > 0, t_hi,
+                                         np.where(p < 0, t_lo, np.inf)))
+    segments = np.flatnonzero(t0 <= t1)
+    if not len(segments):
+        return []
+    start = a[segments] + t0[segments, None] * d[segments]
+    end = a[segments] + t1[segments, None] * d[segments]
+
+    # A piece continues through consecutive segments that keep their
+    # shared vertex; each piece starts with the start of its first segment.
+    begins = np.ones(len(segments), dtype=bool)
+    begins[1:] = ~((np.diff(segments) == 1) & (t1[segments[:-1]] == 1)
+                   & (t0[segments[1:]] == 0))
+    counts = 1 + begins
+    position = np.cumsum(counts) - counts
+    out = np.empty((counts.sum(), 2))
+    out[position[begins]] = start[begins]
+    out[position + begins] = end
+    return np.split(out, position[begins][1:])
+
+
+def _json_default(o):
+    if isinstance(o, np.ndarray):
+        return o.tolist()
+    if isinstance(o, np.generic):
+        return o.item()
+    raise TypeError('Object of type {} is not JSON serializable'
+                    .format(type(o).__name__))
+
+
+if __name__ == '__main__':
+    serve_tiles(*sys.argv[1:2], *map(int, sys.argv[2:3]))
@@ -14,6 +14,566 @@ def test_scatter():
     plt.scatter([0, 10, 0, 10], [0, 0, 10, 10], c=[1, 2, 3, 4])
     spatplotlib.show()
 
+def test_draw_modes():
+    import json
+    from spatplotlib.exporter import Exporter
+    from spatplotlib.leaflet_renderer import LeafletRenderer
+    from spatplotlib.utils import FloatEncoder
+    geojson = []
+    for draw_mode in ['png', 'layout']:
+        plt.scatter([0, 10, 0, 10], [0, 0, 10, 10], c=[1, 2, 3, 4])
+        renderer = LeafletRenderer()
+        Exporter(renderer, draw_mode=draw_mode).run(plt.gcf())
+        geojson.append(json.dumps(renderer.geojson(), cls=FloatEncoder))
+    assert geojson[0] == geojson[1]
+
+def test_epsg():
+    plt.plot([0, 111319.49], [0, 111325.14], 'o-')
+    gj = spatplotlib.fig_to_geojson(epsg=3857)
+    line = gj['features'][0]['geometry']['coordinates']
+    assert abs(line[1][0] - 1) < 1e-6 and abs(line[1][1] - 1) < 1e-4
+    markers = gj['features'][-1]['geometry']['coordinates']
+    assert abs(markers[1][0] - 1) < 1e-6 and abs(markers[1][1] - 1) < 1e-4
+
+def test_transformer_cache():
+    spatplotlib.clear_transformer_cache()
+    for _ in range(3):
+        plt.plot([0, 1e5], [0, 1e5])
+        spatplotlib.fig_to_geojson(epsg=3857)
+    spatplotlib.fig_to_geojson(crs={'init': 'EPSG:3857', 'no_defs': True})
+    info = spatplotlib.transformer_cache_info()
+    assert info.misses == 1 and info.hits == 3
+    spatplotlib.clear_transformer_cache()
+    assert spatplotlib.transformer_cache_info().currsize == 0
+
+def test_scatter_collection():
+    plt.scatter(range(1000), range(1000), c=[i % 3 for i in range(1000)])
+    gj = spatplotlib.fig_to_geojson()
+    assert len(gj['features']) == 1
+    feature = gj['features'][0]
+    assert feature['geometry']['type'] == 'MultiPoint'
+    assert len(feature['geometry']['coordinates']) == 1000
+    assert len(gj['symbols']) == 3
+    assert list(feature['properties']['symbol'][:4]) == [0, 1, 2, 0]
+
+
+def test_symbol_table():
+    plt.plot(range(100), range(100), 'o')
+    plt.plot(range(100), range(100), 'o', color='C0')
+    plt.scatter(range(100), range(100))
+    gj = spatplotlib.fig_to_geojson()
+    assert len(gj['symbols']) == 2
+    assert [set(f['properties']['symbol']) for f in gj['features']] == [
+        {0}, {0}, {1}]
+    assert all('svg' in s['html'] for s in gj['symbols'])
+
+def test_polygon_rings():
+    from matplotlib.path import Path
+    from matplotlib.patches import PathPatch
+    path = Path.make_compound_path(
+        Path([[0, 0], [3, 0], [3, 3], [0, 3], [0, 0]], closed=True),
+        Path([[1, 1], [1, 2], [2, 2], [2, 1], [1, 1]], closed=True))
+    plt.gca().add_patch(PathPatch(path))
+    gj = spatplotlib.fig_to_geojson()
+    rings = gj['features'][0]['geometry']['coordinates']
+    assert rings == [
+        [[0, 0], [3, 0], [3, 3], [0, 3]],
+        [[1, 1], [1, 2], [2, 2], [2, 1]]]
+
+def test_simplify():
+    import numpy as np
+    t = np.linspace(0, 2 * np.pi, 10000)
+    plt.plot(t, np.sin(t))
+    plt.fill(2 + np.cos(t), np.sin(t))
+    plt.fill(0.001 * np.cos(t), 0.001 * np.sin(t))
+    gj = spatplotlib.fig_to_geojson(simplify=1.0)
+    assert len(gj['features']) == 2
+    line = gj['features'][0]['geometry']['coordinates']
+    assert 10 < len(line) < 1000
+    assert line[0] == [0, 0] and line[-1][0] == t[-1]
+    ring = gj['features'][1]['geometry']['coordinates'][0]
+    assert 10 < len(ring) < 1000
+    assert ring[0] == ring[-1]
+
+def test_lod():
+    import numpy as np
+    t = np.linspace(0, 2 * np.pi, 10000)
+    plt.plot(t, np.sin(3 * t))
+    gj = spatplotlib.fig_to_geojson(lod=4)
+    feature = gj['features'][0]
+    assert len(feature['geometry']['coordinates']) == 10000
+    maxzooms = [level['maxzoom'] for level in feature['lod']]
+    sizes = [len(level['coordinates']) for level in feature['lod']]
+    assert maxzooms == sorted(maxzooms, reverse=True)
+    assert sizes == sorted(sizes, reverse=True) and sizes[-1] >= 2
+    plt.plot(t, np.sin(3 * t))
+    assert "map.on('zoomend', updateLod)" in spatplotlib.fig_to_html(lod=4)
+
+def test_vector_tiles(tmp_path):
+    import json
+    import numpy as np
+    t = np.linspace(0, 2 * np.pi, 1000)
+    plt.fill(10 * np.cos(t), 45 + 5 * np.sin(t))
+    plt.plot([-20, 20], [45, 45], 'ko')
+    index = spatplotlib.fig_to_tiles(outdir=str(tmp_path), maxzoom=4,
+                                     processes=1)
+    assert os.path.exists(index)
+    for z in range(5):
+        tiles = list((tmp_path / str(z)).glob('*/*.geojson'))
+        assert tiles
+        for tile in tiles:
+            assert json.loads(tile.read_text())['features']
+
+def test_cluster():
+    import numpy as np
+    rng = np.random.default_rng(0)
+    plt.scatter(rng.uniform(-10, 10, 10000), rng.uniform(40, 50, 10000))
+    gj = spatplotlib.fig_to_geojson(cluster=60)
+    clusters = gj['features'][0]['clusters']
+    sizes = [len(level['count']) for level in clusters]
+    assert sizes[0] == 1 and sizes == sorted(sizes)
+    assert all(sum(level['count']) == 10000 for level in clusters)
+    plt.scatter(rng.uniform(-10, 10, 10000), rng.uniform(40, 50, 10000))
+    assert "map.on('moveend', updateClusters)" in spatplotlib.fig_to_html(
+        cluster=60)
+
+def test_canvas_renderer():
+    import pytest
+    plt.plot([0, 1, 2], [0, 1, 0.5], 'o-')
+    html = spatplotlib.fig_to_html(renderer='canvas')
+    assert 'preferCanvas: true' in html and 'new SymbolMarker' in html
+    plt.plot([0, 1, 2], [0, 1, 0.5], 'o-')
+    gj = spatplotlib.fig_to_geojson()
+    assert {'path', 'radius', 'style'} <= set(gj['symbols'][0])
+    with pytest.raises(ValueError):
+        spatplotlib.fig_to_html(renderer='webgl')
+
+def test_webgl_points():
+    import numpy as np
+    rng = np.random.default_rng(0)
+    plt.scatter(rng.uniform(size=1000), rng.uniform(size=1000),
+                c=rng.uniform(size=1000), s=rng.uniform(5, 50, 1000))
+    gj = spatplotlib.fig_to_geojson(points='webgl')
+    assert gj['features'] == []
+    layer, = gj['points']
+    assert len(layer['positions']) == 2000 and len(layer['colors']) == 4000
+    assert len(layer['sizes']) == 1000 and min(layer['sizes']) > 0
+    plt.scatter(rng.uniform(size=1000), rng.uniform(size=1000))
+    assert 'new PointLayer(data)' in spatplotlib.fig_to_html(points='webgl')
+
+def test_marker_colors():
+    for kwargs in ({}, {'cluster': 60}, {'points': 'webgl'}):
+        plt.plot([0, 1, 2], [0, 1, 0], 'o', markerfacecolor=(1, 0, 0, 0.5))
+        assert 'rgba(255, 0, 0, 0.5)' in spatplotlib.fig_to_html(**kwargs)
+        plt.close()
+    plt.plot([0, 1], [0, 1], 'o', markerfacecolor=(1, 0, 0, 0.5))
+    layer, = spatplotlib.fig_to_geojson(points='webgl')['points']
+    assert layer['colors'][:4] == [255, 0, 0, 128]
+    plt.close()
+    plt.plot([0, 1], [0, 1], 'o', markerfacecolor='none',
+             markeredgecolor='b', alpha=0.5)
+    layer, = spatplotlib.fig_to_geojson(points='webgl')['points']
+    assert layer['colors'][:4] == [0, 0, 255, 128]
+    plt.close()
+
+def test_binary(tmp_path):
+    import numpy as np
+    from spatplotlib.display import _geojson
+    from spatplotlib.encoding import pack_buffers
+    t = np.linspace(0, 2 * np.pi, 100)
+    plt.plot(t, np.sin(t), 'o-')
+    gj = _geojson()
+    packed, buffer = pack_buffers(gj)
+    line = packed['features'][0]['geometry']['coordinates']
+    assert line == {'@f': 0, 'n': 100, 'd': 2}
+    assert np.array_equal(np.frombuffer(buffer[:1600]).reshape(-1, 2),
+                          gj['features'][0]['geometry']['coordinates'])
+    plt.plot(t, np.sin(t), 'o-')
+    assert 'loadData(gjData)' in spatplotlib.fig_to_html(binary='base64')
+    plt.plot(t, np.sin(t), 'o-')
+    spatplotlib.save_html(fileobj=str(tmp_path / 'map.html'), binary='sidecar')
+    assert (tmp_path / 'map.bin').stat().st_size == len(buffer)
+
+def test_quantize():
+    import numpy as np
+    from spatplotlib.display import _geojson
+    from spatplotlib.encoding import quantize
+    t = np.linspace(0, 2 * np.pi, 100)
+    plt.plot(t, np.sin(t), 'o-')
+    gj = _geojson()
+    quantized = quantize(gj, 6)
+    transform = quantized['transform']
+    for feature, encoded in zip(gj['features'], quantized['features']):
+        steps = encoded['geometry']['coordinates']['dq'].reshape(-1, 2)
+        decoded = (np.cumsum(steps, axis=0) * transform['scale']
+                   + transform['translate'])
+        assert np.allclose(decoded, feature['geometry']['coordinates'],
+                           atol=1e-6)
+    plt.plot(t, np.sin(t))
+    html = spatplotlib.fig_to_html(quantize=True, binary='base64')
+    assert 'loadData(gjData).then(dequantize).then(addLayers);' in html
+
+def test_topojson():
+    import numpy as np
+    # Two squares sharing their middle edge, and a line along it
+    plt.fill([0, 1, 1, 0], [0, 0, 1, 1])
+    plt.fill([1, 2, 2, 1], [0, 0, 1, 1])
+    plt.plot([1, 1], [0, 1])
+    topo = spatplotlib.fig_to_topojson()
+    arcs = topo['arcs']
+    geometries = topo['objects']['figure']['geometries']
+    polygons = [g for g in geometries if g['type'] == 'Polygon']
+    line, = [g['arcs'] for g in geometries if g['type'] == 'LineString']
+    # The shared edge is stored once
+    assert len(polygons) == 2 and len(arcs) == 3
+    refs = [np.concatenate(g['arcs']) for g in polygons]
+    shared = np.intersect1d(np.where(refs[0] < 0, ~refs[0], refs[0]),
+                            np.where(refs[1] < 0, ~refs[1], refs[1]))
+    assert len(shared) == 1
+    assert len(line) == 1 and (line[0] == shared[0] or ~line[0] == shared[0])
+    plt.fill([0, 1, 1, 0], [0, 0, 1, 1])
+    arc, = spatplotlib.fig_to_topojson()['arcs']
+    plt.fill([0, 1, 1, 0], [0, 0, 1, 1])
+    quantized = spatplotlib.fig_to_topojson(quantize=True)
+    scale = quantized['transform']['scale']
+    translate = quantized['transform']['translate']
+    decoded = np.cumsum(quantized['arcs'][0], axis=0) * scale + translate
+    assert np.allclose(decoded, arc, atol=1e-6)
+    plt.fill([0, 1, 1, 0], [0, 0, 1, 1])
+    html = spatplotlib.fig_to_html(topojson=True, quantize=True)
+    assert 'Promise.resolve(gjData).then(fromTopology).then(addLayers);' in html
+
+def test_topojson_hash_collisions(monkeypatch):
+    import numpy as np
+    from spatplotlib import topojson
+    # With a zero base every arc hashes to 0, so arcs of the same length
+    # and ends have the same key
+    monkeypatch.setattr(topojson, '_hash_base', np.uint64(0))
+    plt.plot([0, 1, 2], [0, 1, 0])
+    plt.plot([0, 1, 2], [0, -1, 0])
+    plt.plot([2, 1, 0], [0, 1, 0])
+    topo = spatplotlib.fig_to_topojson()
+    assert len(topo['arcs']) == 2
+    a, b, c = [g['arcs'] for g in topo['objects']['figure']['geometries']]
+    assert a != b and c == [~a[0]]
+    np.testing.assert_allclose(topo['arcs'][b[0]], [[0, 0], [1, -1], [2, 0]])
+    plt.close()
+
+def test_array_encoder():
+    import json
+    import numpy as np
+    from spatplotlib.display import _geojson
+    from spatplotlib.utils import ArrayEncoder, FloatEncoder
+    t = np.linspace(0, 2 * np.pi, 100)
+    plt.plot(t, np.sin(t), 'o-')
+    plt.fill(np.cos(t), np.sin(t))
+    gj = _geojson()
+    gj['properties'] = {'nan': float('nan'),
+                        'values': np.array([-1e-9, 1e300])}
+    expected = json.dumps(gj, cls=FloatEncoder, precision=6)
+    assert json.dumps(gj, cls=ArrayEncoder, precision=6) == expected
+    chunks = list(ArrayEncoder(precision=6, batch_size=10).iterencode(gj))
+    assert len(chunks) > 1 and ''.join(chunks) == expected
+
+def test_geojson_json():
+    import json
+    import numpy as np
+    t = np.linspace(0, 2 * np.pi, 100)
+    plt.plot(t, np.sin(t), 'o-')
+    plt.fill(np.cos(t), np.sin(t))
+    plt.scatter(t, t, c=t)
+    for gj in (spatplotlib.fig_to_geojson(cluster=60),
+               spatplotlib.fig_to_geojson(points='webgl', lod=3),
+               spatplotlib.fig_to_topojson(quantize=True)):
+        assert json.loads(json.dumps(gj)) == gj
+    plt.close()
+
+def test_concurrent_exports():
+    import json
+    import re
+    from concurrent.futures import ThreadPoolExecutor
+    import numpy as np
+    from matplotlib.figure import Figure
+    from spatplotlib.utils import FloatEncoder
+    t = np.linspace(0, 1, 200)
+
+    def export(precision):
+        # pyplot is not thread-safe, figures are made without it
+        fig = Figure()
+        ax = fig.add_subplot()
+        ax.plot(t, t / 3, 'o-')
+        ax.fill(t, np.sin(t) / 7)
+        gj = spatplotlib.fig_to_html(fig, float_precision=precision,
+                                     generator=lambda **p: p['geojson'])
+        fig = Figure()
+        fig.add_subplot().plot(t, t / 3)
+        gj_float = json.dumps(spatplotlib.fig_to_geojson(fig),
+                              cls=FloatEncoder, precision=precision)
+        return precision, gj, gj_float
+
+    precisions = [1, 2, 3, 4, 5, 6, 7, 8] * 4
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(export, precisions))
+    assert [r[0] for r in results] == precisions
+    for precision, gj, gj_float in results:
+        for text in (gj, gj_float):
+            # Numbers outside of strings (e.g. the SVG of the symbols)
+            text = re.sub(r'"(?:[^"\\]|\\.)*"', '""', text)
+            decimals = re.findall(r'\d\.(\d+)', text)
+            assert decimals and {len(d) for d in decimals} == {precision}
+
+def test_iter_html(tmp_path):
+    import json
+    import numpy as np
+    t = np.linspace(0, 1, 1000)
+    plt.plot(t, t ** 2)
+    chunks = list(spatplotlib.iter_html(generator=lambda **p: p['geojson']))
+    plt.plot(t, t ** 2)
+    assert ''.join(chunks) == json.dumps(spatplotlib.fig_to_geojson(),
+                                         cls=spatplotlib.utils.FloatEncoder,
+                                         precision=6)
+    plt.plot(t, t ** 2)
+    chunks = list(spatplotlib.iter_html())
+    assert len(chunks) >= 3 and chunks[0].startswith('<head>')
+    html = ''.join(chunks)
+    assert 'var gjData = {"type": "FeatureCollection"' in html
+    plt.plot(t, t ** 2)
+    spatplotlib.save_html(fileobj=str(tmp_path / 'map.html'))
+    assert (tmp_path / 'map.html').read_text().startswith(chunks[0][:100])
+
+def test_display_modes(tmp_path, monkeypatch):
+    import re
+    import sys
+    import urllib.request
+    monkeypatch.chdir(tmp_path)
+    srcs = []
+    for _ in range(2):
+        plt.plot([0, 1, 2], [0, 1, 0.5], 'o-')
+        html = spatplotlib.display(mode='file').data
+        srcs.append(re.search('src="([^"]*)"', html).group(1))
+    # Without a Jupyter server the working directory is the root
+    assert srcs[0] == srcs[1] and srcs[0].startswith('/files/_spatplotlib/')
+    assert len(list((tmp_path / '_spatplotlib').iterdir())) == 1
+    name = srcs[0].split('/')[-1]
+    assert 'var gjData' in (tmp_path / '_spatplotlib' / name).read_text()
+    display_module = sys.modules['spatplotlib.display']
+    monkeypatch.setattr(display_module, '_jupyter_server',
+                        lambda: (str(tmp_path.parent), '/user/me/'))
+    plt.plot([0, 1, 2], [0, 1, 0.5], 'o-')
+    html = spatplotlib.display(mode='file').data
+    assert 'src="/user/me/files/{}/_spatplotlib/{}"'.format(
+        tmp_path.name, name) in html
+    plt.plot([0, 1, 2], [0, 1, 0.5], 'o-')
+    html = spatplotlib.display(mode='server').data
+    src = re.search('src="([^"]*)"', html).group(1)
+    assert src.startswith('http://127.0.0.1:')
+    with urllib.request.urlopen(src) as response:
+        assert b'var gjData' in response.read()
+
+def test_sidecar_data(tmp_path):
+    import gzip
+    import json
+    import numpy as np
+    t = np.linspace(0, 2 * np.pi, 10000)
+    plt.plot(t, np.sin(t))
+    spatplotlib.save_html(fileobj=str(tmp_path / 'map.html'), data='sidecar',
+                          compress='gzip')
+    html = (tmp_path / 'map.html').read_text()
+    assert len(html) < 20000
+    assert 'fetchData(gjData).then(addLayers);' in html
+    assert '"url": "map.geojson.gz"' in html
+    with gzip.open(tmp_path / 'map.geojson.gz', 'rt') as f:
+        gj = json.load(f)
+    assert len(gj['features'][0]['geometry']['coordinates']) == 10000
+
+def test_compressed_payload():
+    import base64
+    import json
+    import re
+    import zlib
+    import numpy as np
+    t = np.linspace(0, 2 * np.pi, 10000)
+    for compress, wbits in [('gzip', 31), ('deflate', 15)]:
+        plt.plot(t, np.sin(t))
+        html = spatplotlib.fig_to_html(compress=compress)
+        assert 'inflateData(gjData).then(addLayers);' in html
+        payload = json.loads(re.search('var gjData = (.*);', html).group(1))
+        assert payload['compressed'] == compress
+        text = zlib.decompress(base64.b64decode(payload['data']), wbits)
+        gj = json.loads(text)
+        assert len(gj['features'][0]['geometry']['coordinates']) == 10000
+        plt.plot(t, np.sin(t))
+        assert len(html) < len(spatplotlib.fig_to_html()) / 2
+
+def test_asset_cache(tmp_path, monkeypatch):
+    from spatplotlib import links
+    from spatplotlib.display import _leaflet_js, _leaflet_css
+    monkeypatch.setenv('SPATPLOTLIB_ASSETS', str(tmp_path / 'assets'))
+    monkeypatch.setattr(links, '_assets', {})
+    def offline(*args, **kwargs):
+        raise OSError('offline')
+    monkeypatch.setattr(links.urllib.request, 'urlopen', offline)
+    for link, text in [(_leaflet_js, 'var L = {};'),
+                       (_leaflet_css, '.leaflet-pane {}')]:
+        (tmp_path / 'asset').write_text(text)
+        links.cache_asset(link.url, str(tmp_path / 'asset'))
+    # Read back from the disk, as in a new process
+    monkeypatch.setattr(links, '_assets', {})
+    plt.plot([0, 1], [0, 1])
+    html = spatplotlib.fig_to_html(embed_links=True)
+    assert '<script>var L = {};</script>' in html
+    assert '<style>.leaflet-pane {}</style>' in html
+    try:
+        links.fetch('https://example.com/missing.js')
+        assert False
+    except OSError as e:
+        assert 'cache_asset' in str(e)
+    # A hung download does not block the assets already cached
+    import threading
+    started, release = threading.Event(), threading.Event()
+    finished = []
+    def hung(*args, **kwargs):
+        started.set()
+        release.wait(10)
+        finished.append(True)
+        raise OSError('timed out')
+    monkeypatch.setattr(links.urllib.request, 'urlopen', hung)
+    monkeypatch.setattr(links, '_assets', {})
+    def slow():
+        try:
+            links.fetch('https://example.com/slow.js')
+        except OSError:
+            pass
+    thread = threading.Thread(target=slow)
+    thread.start()
+    assert started.wait(10)
+    assert links.fetch(_leaflet_js.url) == 'var L = {};'
+    assert not finished
+    release.set()
+    thread.join()
+
+def test_image_overlay():
+    import base64
+    import io
+    import numpy as np
+    from PIL import Image
+    z = np.add.outer(np.arange(50.), np.arange(80.))
+    plt.imshow(z, extent=(-10, 30, 40, 60), origin='lower', alpha=0.5)
+    plt.plot([-10, 30], [40, 60])
+    gj = spatplotlib.fig_to_geojson()
+    image, = gj['images']
+    np.testing.assert_allclose(image['bounds'], [[40, -10], [60, 30]])
+    assert image['opacity'] == 0.5
+    png = base64.b64decode(image['url'][len('data:image/png;base64,'):])
+    rgba = np.asarray(Image.open(io.BytesIO(png)))
+    # Warped to Web Mercator: rows stretch towards the north
+    assert rgba.shape[1] == 80 and rgba.shape[0] > 50
+    viridis = plt.get_cmap('viridis')
+    assert tuple(rgba[-1, 0]) == viridis(0, bytes=True)
+    assert tuple(rgba[0, -1]) == viridis(1.0, bytes=True)
+    plt.imshow(z, extent=(-10, 30, 40, 60))
+    html = spatplotlib.fig_to_html()
+    assert 'L.imageOverlay(image.url' in html
+
+def test_raster_tiles(tmp_path):
+    import numpy as np
+    path = str(tmp_path / 'raster.npy')
+    data = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32,
+                                     shape=(512, 1024))
+    data[:] = np.linspace(0, 1, 1024)
+    data[:, :10] = np.nan
+    del data
+    for processes in [1, 2]:
+        outdir = tmp_path / 'tiles{}'.format(processes)
+        meta = spatplotlib.raster_to_tiles(path, (0, 90, 0, 45), str(outdir),
+                                           processes=processes)
+        assert meta['url'] == '{z}/{x}/{y}.png'
+        assert meta['minzoom'] == 0 and meta['maxzoom'] == 4
+        np.testing.assert_allclose(meta['bounds'], [0, 0, 90, 45])
+        tiles = sorted(p.relative_to(outdir).as_posix()
+                       for p in outdir.rglob('*.png'))
+        assert tiles[:3] == ['0/0/0.png', '1/1/0.png', '2/2/1.png']
+        assert len(tiles) == 1 + 1 + 1 + 4 + 12
+
+def test_quadmesh_raster():
+    import base64
+    import io
+    import numpy as np
+    from PIL import Image
+    x, y = np.linspace(-20, 40, 101), np.linspace(30, 60, 81)
+    c = np.add.outer(np.arange(80.), np.arange(100.))
+    X, Y = np.meshgrid(x, y)
+    for X in [X, X + 5 * np.sin(np.radians(Y) * 4)]:
+        plt.pcolormesh(X, Y, c)
+        gj = spatplotlib.fig_to_geojson()
+        assert gj['features'] == []
+        image, = gj['images']
+        np.testing.assert_allclose(image['bounds'],
+                                   [[30, X.min()], [60, X.max()]])
+        png = base64.b64decode(image['url'][len('data:image/png;base64,'):])
+        rgba = np.asarray(Image.open(io.BytesIO(png)))
+        assert (rgba[..., 3] == 255).mean() > 0.8
+    # An alpha per cell is in the colors of the image
+    plt.pcolormesh(x, y, c, alpha=np.tile(np.linspace(0, 1, 100), (80, 1)))
+    image, = spatplotlib.fig_to_geojson()['images']
+    png = base64.b64decode(image['url'][len('data:image/png;base64,'):])
+    alpha = np.asarray(Image.open(io.BytesIO(png)))[..., 3]
+    assert image['opacity'] == 1
+    assert alpha[:, 0].max() == 0 and alpha[:, -1].min() == 255
+    plt.close()
+    # Values of the vertices are interpolated across the cells
+    c = np.add.outer(np.arange(81.), np.arange(101.))
+    plt.pcolormesh(x, y, c, shading='gouraud')
+    gj = spatplotlib.fig_to_geojson()
+    assert gj['features'] == [] and len(gj['images']) == 1
+    plt.close()
+    # Small meshes are drawn as polygons
+    plt.pcolormesh(np.arange(11), np.arange(11), np.ones((10, 10)))
+    gj = spatplotlib.fig_to_geojson()
+    assert len(gj['features']) == 100 and 'images' not in gj
+
+def test_contour_levels():
+    import numpy as np
+    x, y = np.meshgrid(np.linspace(-10, 10, 101), np.linspace(-10, 10, 101))
+    z = np.hypot(x, y) + 3 * (np.abs(x) > 6)
+    cs = plt.contour(x, y, z, levels=[2, 4, 8])
+    gj = spatplotlib.fig_to_geojson()
+    assert [f['geometry']['type'] for f in gj['features']] == \
+        ['MultiLineString'] * 3
+    assert [f['properties']['level'] for f in gj['features']] == [2, 4, 8]
+    # Every segment of a level is kept
+    for feature, segments in zip(gj['features'], cs.allsegs):
+        assert len(feature['geometry']['coordinates']) == len(segments)
+    plt.close()
+
+    plt.contourf(x, y, np.hypot(x, y), levels=[1, 2, 3])
+    gj = spatplotlib.fig_to_geojson()
+    assert [f['properties']['level'] for f in gj['features']] == \
+        [[1, 2], [2, 3]]
+    # The annuli are one polygon each, their inner ring being a hole
+    for feature in gj['features']:
+        assert feature['geometry']['type'] == 'MultiPolygon'
+        polygon, = feature['geometry']['coordinates']
+        assert len(polygon) == 2
+    topo = spatplotlib.topojson.topology(gj, precision=6)
+    a, b = topo['objects']['figure']['geometries']
+    assert a['type'] == 'MultiPolygon' and len(a['arcs'][0]) == 2
+    # The boundary of the bands is shared
+    assert set(np.ravel(a['arcs'][0][0])) & {~r for r in np.ravel(b['arcs'])}
+    plt.close()
+
+    # Extended bands are open on one side
+    for extend, levels in [('both', [[None, 2], [2, 4], [4, 6], [6, None]]),
+                           ('max', [[2, 4], [4, 6], [6, None]])]:
+        plt.contourf(x, y, z, levels=[2, 4, 6], extend=extend)
+        gj = spatplotlib.fig_to_geojson()
+        assert [f['geometry']['type'] for f in gj['features']] == \
+            ['MultiPolygon'] * len(levels)
+        assert [f['properties']['level'] for f in gj['features']] == levels
+        plt.contourf(x, y, z, levels=[2, 4, 6], extend=extend)
+        assert 'null]' in spatplotlib.fig_to_html()
+        plt.close()
+
 test_basic_tiles()
 
 ipynbtest = """